@@ -1,78 +1,71 @@
-import os
-import shutil
+import asyncio
+from typing import Optional
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import JSONResponse
-from ray.job_submission import JobSubmissionClient
 
+from jobs.service import get_ingestion_service
 from schema.base import GithubIngestionPayload, S3IngestionPayload
-from settings import settings
 
 router = APIRouter()
 
-current_dir = os.getcwd()
-runtime_dir = os.path.join(current_dir, "runtime")
 
-
-def create_runtime_files():
-    if not os.path.exists(runtime_dir):
-        files_to_copy = ["settings.py", "constants.py", ".env"]
-        folders_to_copy = ["jobs", "schema"]
-        try:
-            for folder in folders_to_copy:
-                dest_path = os.path.join(runtime_dir, os.path.basename(folder))
-                shutil.copytree(folder, dest_path)
-
-            for file_path in files_to_copy:
-                dest_path = os.path.join(runtime_dir, os.path.basename(file_path))
-                shutil.copy(file_path, dest_path)
-        except FileNotFoundError as e:
-            print(f"Error: {e}")
+async def _get_service():
+    # Resolving the service blocks (building the runtime package, replacing a
+    # service from older code), so it stays off the replica's event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_ingestion_service)
 
 
 @router.post("/github")
 async def submit_github_ingestion_job(payload: GithubIngestionPayload):
-    create_runtime_files()
-    client = JobSubmissionClient(settings.RAY_DASHBOARD_ADDRESS)
-    job_id = client.submit_job(
-        entrypoint=f"python -m jobs.ingestion.job --payload '{payload.model_dump_json()}'",
-        runtime_env={"working_dir": runtime_dir, "pip": ["llama-hub"]},
-    )
-    return JSONResponse(status_code=200, content={"job_id": job_id})
+    service = await _get_service()
+    result = await service.submit.remote(payload)
+    return JSONResponse(status_code=200, content=result)
 
 
 @router.post("/s3")
 async def submit_s3_ingestion_job(payload: S3IngestionPayload):
-    create_runtime_files()
-    client = JobSubmissionClient(settings.RAY_DASHBOARD_ADDRESS)
-    job_id = client.submit_job(
-        entrypoint=f"python -m jobs.ingestion.job --payload '{payload.model_dump_json()}'",
-        runtime_env={"working_dir": runtime_dir, "pip": ["llama-hub"]},
-    )
-    return JSONResponse(status_code=200, content={"job_id": job_id})
+    service = await _get_service()
+    result = await service.submit.remote(payload)
+    return JSONResponse(status_code=200, content=result)
+
+
+@router.delete("/assets/{asset_id}")
+async def delete_asset(asset_id: str):
+    # Through the service, so no queued or running job writes the asset back
+    service = await _get_service()
+    await service.delete_asset.remote(asset_id)
+    return JSONResponse(status_code=200, content={"asset_id": asset_id})
 
 
 @router.get("/jobs")
-async def list_jobs():
-    client = JobSubmissionClient(settings.RAY_DASHBOARD_ADDRESS)
-    jobs = client.list_jobs()
-    result = [job.json() for job in jobs]
-    return JSONResponse(status_code=200, content={"jobs": result})
+async def list_jobs(
+    owner: Optional[str] = None, status: Optional[str] = None, limit: int = 100
+):
+    service = await _get_service()
+    jobs = await service.list_jobs.remote(owner, status, limit)
+    return JSONResponse(status_code=200, content={"jobs": jobs})
+
+
+@router.get("/queue")
+async def get_queue_stats():
+    service = await _get_service()
+    stats = await service.get_stats.remote()
+    return JSONResponse(status_code=200, content=stats)
 
 
 @router.delete("/{job_id}")
 async def stop_job(job_id: str):
-    client = JobSubmissionClient(settings.RAY_DASHBOARD_ADDRESS)
-    result = client.stop_job(job_id)
+    service = await _get_service()
+    result = await service.cancel.remote(job_id)
     return JSONResponse(status_code=200, content={"result": result})
 
 
 @router.get("/{job_id}")
 async def get_job_status(job_id: str):
-    client = JobSubmissionClient(settings.RAY_DASHBOARD_ADDRESS)
-    status = client.get_job_status(job_id)
-    logs = client.get_job_logs(job_id)
-    info = client.get_job_info(job_id)
-    return JSONResponse(
-        status_code=200, content={"status": status, "logs": logs, "info": info.json()}
-    )
+    service = await _get_service()
+    job = await service.get_job.remote(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JSONResponse(status_code=200, content=job)
@@ -1,116 +1,248 @@
-from typing import List
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional
 
-from qdrant_client import QdrantClient
+from fastapi import Response
+from fastapi.responses import StreamingResponse
 from qdrant_client.http import models
 from ray import serve
-from sentence_transformers import SentenceTransformer
-import torch
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
-from stop_words import get_stop_words
-from transformers import AutoModel
+from ray.serve.handle import DeploymentHandle
 
 from api.fastapi.base import app
-from schema.base import Context, RetrievalPayload
+from schema.base import (
+    BatchRetrievalPayload,
+    BatchRetrievalResult,
+    Context,
+    RetrievalPayload,
+)
 from settings import settings
+from utils.asset_versions import get_asset_versions
+from utils.logger import logger
+from utils.query_cache import QueryCache
 
 
 @serve.deployment()
 @serve.ingress(app)
 class ServeDeployment:
-    def __init__(self):
-        self.stop_words = get_stop_words("en")
-        self.reranker_tokenizer = AutoTokenizer.from_pretrained(settings.RERANKER_MODEL)
-        self.reranker_model = AutoModelForSequenceClassification.from_pretrained(settings.RERANKER_MODEL)
-        self.reranker_model.eval()
-        if settings.USE_SENTENCE_TRANSFORMERS:
-            self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+    """Thin ingress composing the QueryEmbedder, VectorSearcher and Reranker
+    deployments, which are scaled and sized independently.
+
+    Results are cached per replica. Asset versions are polled every
+    QUERY_CACHE_VERSION_REFRESH_S, so a finished ingestion job invalidates the
+    affected entries within that interval.
+    """
+
+    def __init__(
+        self,
+        embedder: DeploymentHandle,
+        searcher: DeploymentHandle,
+        reranker: DeploymentHandle,
+    ):
+        self.embedder = embedder
+        self.searcher = searcher
+        self.reranker = reranker
+        self.query_cache = (
+            QueryCache(settings.QUERY_CACHE_MAX_ENTRIES, settings.QUERY_CACHE_TTL_S)
+            if settings.QUERY_CACHE_ENABLED
+            else None
+        )
+        # None until the first poll succeeds (and after a failed one), the cache is
+        # bypassed meanwhile
+        self.asset_versions: Optional[Dict[str, str]] = None
+        self._version_refresh: Optional[asyncio.Task] = None
+
+    async def _refresh_asset_versions(self):
+        while True:
+            try:
+                registry = get_asset_versions()
+                self.asset_versions = await registry.get_versions.remote()
+            except Exception as e:
+                logger.error(f"Failed to refresh asset versions: {e}")
+                self.asset_versions = None
+            await asyncio.sleep(settings.QUERY_CACHE_VERSION_REFRESH_S)
+
+    def _get_asset_versions(self) -> Optional[Dict[str, str]]:
+        if self._version_refresh is None:
+            self._version_refresh = asyncio.get_running_loop().create_task(
+                self._refresh_asset_versions()
+            )
+        return self.asset_versions
+
+    @staticmethod
+    def _to_contexts(contexts: List[models.ScoredPoint]) -> List[Context]:
+        return [
+            Context(
+                text=context.payload.get("text"),
+                metadata=context.payload.get("metadata"),
+                score=context.score,
+            )
+            for context in contexts
+        ]
+
+    async def _retrieve(
+        self, request: RetrievalPayload, timings: Dict[str, float]
+    ) -> List[Context]:
+        start = time.perf_counter()
+        vector = await self.embedder.embed.remote(request.query)
+        timings["embed"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        contexts = await self.searcher.search.remote(
+            request.query, request.asset_ids, vector, request.num_contexts
+        )
+        timings["search"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if request.rerank_mode == "off":
+            reranked_contexts = self._to_contexts(contexts)
         else:
-            self.embedding_model = AutoModel.from_pretrained(
-                settings.EMBEDDING_MODEL, trust_remote_code=True
+            reranked_contexts = await self.reranker.rerank.remote(
+                request.query, contexts, request.score_threshold, request.rerank_mode
             )
-        self.vector_store_client = QdrantClient(
-            url=settings.QDRANT_BASE_URI,
-            api_key=settings.QDRANT_API_KEY,
-            https=settings.QDRANT_USE_HTTPS,
+        timings["rerank"] = time.perf_counter() - start
+        return reranked_contexts
+
+    @app.post("/retrieve", tags=["Retrieval"], response_model=List[Context])
+    async def get_contexts(self, request: RetrievalPayload, response: Response):
+        timings = {}
+        versions = self._get_asset_versions() if self.query_cache else None
+        key = QueryCache.get_key(request)
+
+        reranked_contexts = None
+        if versions is not None:
+            start = time.perf_counter()
+            reranked_contexts = self.query_cache.get(key, versions)
+            timings["cache"] = time.perf_counter() - start
+        if reranked_contexts is None:
+            reranked_contexts = await self._retrieve(request, timings)
+            if versions is not None:
+                self.query_cache.put(key, versions, reranked_contexts)
+
+        response.headers["Server-Timing"] = ", ".join(
+            f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items()
         )
+        return reranked_contexts
 
-    def _remove_stopwords(self, text: str) -> str:
-        return " ".join([word for word in text.split() if word not in self.stop_words])
-
-    def _get_query_embedding(self, query: str) -> List[float]:
-        processed_query = self._remove_stopwords(query)
-        embeddings = self.embedding_model.encode([processed_query]).tolist()
-        return embeddings[0]
-
-    def _search_chunks_by_vector(
-        self, asset_ids: List[str], vector: List[float], limit
-    ) -> List[models.ScoredPoint]:
-        # Implement this: https://qdrant.tech/articles/hybrid-search/
-        collections = self.vector_store_client.search(
-            collection_name=settings.VECTOR_DB_COLLECTION_NAME,
-            query_vector=vector,
-            query_filter=models.Filter(
-                should=[
-                    models.FieldCondition(
-                        key="asset_id",
-                        match=models.MatchValue(
-                            value=asset_id,
-                        ),
-                    )
-                    for asset_id in asset_ids
-                ]
-                if len(asset_ids) > 0
-                else None,
-            ),
-            with_payload=True,
-            with_vectors=False,
-            limit=limit * 10,  # get more elements to remove duplicates
+    async def _search_many(
+        self, requests: List[RetrievalPayload]
+    ) -> List[List[models.ScoredPoint]]:
+        # One embedding forward pass and one Qdrant round trip for all queries
+        vectors = await self.embedder.embed_many.remote(
+            [request.query for request in requests]
+        )
+        return await self.searcher.search_many.remote(
+            [
+                (request.query, request.asset_ids, vector, request.num_contexts)
+                for request, vector in zip(requests, vectors)
+            ]
         )
-        unique = []
-        seen_scores = set()
-        for c in collections:
-            if c.score not in seen_scores:
-                seen_scores.add(c.score)
-                unique.append(c)
-        return unique[:limit]
-
-    def _rerank_contexts(
+
+    async def _rerank_many(
         self,
-        query: str,
-        contexts: List[models.ScoredPoint],
-        score_threshold: float = 1,
-    ) -> List[Context]:
-        if len(contexts) == 0:
-            return []
-        query_paragraph_pair = [[query, context.payload.get("text")] for context in contexts]
-        with torch.no_grad():
-            inputs = self.reranker_tokenizer(query_paragraph_pair, padding=True, truncation=True, return_tensors='pt', max_length=512)
-            scores = self.reranker_model(**inputs, return_dict=True).logits.view(-1, ).float()
-        scores = scores.tolist()
-
-        # Update scores in the ranked_chunks
-        relevant_contexts = []
-        seen_scores = set()
-        for context, score in zip(contexts, scores):
-            if score >= score_threshold and score not in seen_scores:
-                seen_scores.add(score)
-                relevant_contexts.append(
-                    Context(
-                        text=context.payload.get("text"),
-                        metadata=context.payload.get("metadata"),
-                        score=score,
+        requests: List[RetrievalPayload],
+        candidates: List[List[models.ScoredPoint]],
+    ) -> List[List[Context]]:
+        results = [self._to_contexts(contexts) for contexts in candidates]
+        reranked = [i for i, r in enumerate(requests) if r.rerank_mode != "off"]
+        if reranked:
+            contexts = await self.reranker.rerank_many.remote(
+                [
+                    (
+                        requests[i].query,
+                        candidates[i],
+                        requests[i].score_threshold,
+                        requests[i].rerank_mode,
                     )
+                    for i in reranked
+                ]
+            )
+            for i, reranked_contexts in zip(reranked, contexts):
+                results[i] = reranked_contexts
+        return results
+
+    @staticmethod
+    def _to_ndjson(index: int, contexts: List[Context]) -> str:
+        result = BatchRetrievalResult(index=index, contexts=contexts)
+        return result.model_dump_json() + "\n"
+
+    async def _stream_batch(
+        self,
+        requests: List[RetrievalPayload],
+        cached: Dict[int, List[Context]],
+        versions: Optional[Dict[str, str]],
+    ) -> AsyncIterator[str]:
+        for i, contexts in cached.items():
+            yield self._to_ndjson(i, contexts)
+        misses = [i for i in range(len(requests)) if i not in cached]
+        if not misses:
+            return
+        candidates = await self._search_many([requests[i] for i in misses])
+
+        async def rerank(i: int, contexts: List[models.ScoredPoint]):
+            request = requests[i]
+            if request.rerank_mode == "off":
+                return i, self._to_contexts(contexts)
+            # Concurrent calls are batched by the reranker's serve.batch
+            return i, await self.reranker.rerank.remote(
+                request.query, contexts, request.score_threshold, request.rerank_mode
+            )
+
+        tasks = [rerank(i, contexts) for i, contexts in zip(misses, candidates)]
+        for task in asyncio.as_completed(tasks):
+            i, contexts = await task
+            if versions is not None:
+                self.query_cache.put(
+                    QueryCache.get_key(requests[i]), versions, contexts
                 )
-        relevant_contexts.sort(key=lambda x: x.score, reverse=True)
-        return relevant_contexts
+            yield self._to_ndjson(i, contexts)
 
-    @app.post("/retrieve", tags=["Retrieval"], response_model=List[Context])
-    def get_contexts(self, request: RetrievalPayload):
-        vector = self._get_query_embedding(request.query)
-        contexts = self._search_chunks_by_vector(
-            request.asset_ids, vector, request.num_contexts
-        )
-        reranked_contexts = self._rerank_contexts(
-            request.query, contexts, request.score_threshold
-        )
-        return reranked_contexts
+    @app.post(
+        "/retrieve/batch",
+        tags=["Retrieval"],
+        response_model=List[BatchRetrievalResult],
+    )
+    async def get_contexts_batch(self, request: BatchRetrievalPayload):
+        requests = request.queries
+        versions = self._get_asset_versions() if self.query_cache else None
+        cached: Dict[int, List[Context]] = {}
+        if versions is not None:
+            for i, query in enumerate(requests):
+                contexts = self.query_cache.get(QueryCache.get_key(query), versions)
+                if contexts is not None:
+                    cached[i] = contexts
+
+        if request.stream:
+            return StreamingResponse(
+                self._stream_batch(requests, cached, versions),
+                media_type="application/x-ndjson",
+            )
+
+        results = dict(cached)
+        misses = [i for i in range(len(requests)) if i not in cached]
+        if misses:
+            miss_requests = [requests[i] for i in misses]
+            candidates = await self._search_many(miss_requests)
+            reranked = await self._rerank_many(miss_requests, candidates)
+            for i, contexts in zip(misses, reranked):
+                results[i] = contexts
+                if versions is not None:
+                    self.query_cache.put(
+                        QueryCache.get_key(requests[i]), versions, contexts
+                    )
+        return [
+            BatchRetrievalResult(index=i, contexts=results[i])
+            for i in range(len(requests))
+        ]
+
+    @app.get("/retrieve/cache", tags=["Retrieval"])
+    async def get_query_cache_stats(self):
+        """Query cache metrics of the replica serving the request, and embedding
+        cache metrics of the QueryEmbedder replica that answers."""
+        embedding_cache = await self.embedder.get_stats.remote()
+        if self.query_cache is None:
+            return {"enabled": False, "embedding_cache": embedding_cache}
+        return {
+            "enabled": True,
+            **self.query_cache.get_stats(),
+            "embedding_cache": embedding_cache,
+        }
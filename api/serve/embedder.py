@@ -0,0 +1,80 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from ray import serve
+
+from settings import settings
+from utils.embedding_cache import get_embedding_cache
+from utils.inference import load_embedding_model
+from utils.text import TextPreprocessor
+
+
+@serve.deployment(ray_actor_options={"num_cpus": 1})
+class QueryEmbedder:
+    """Embeds queries, batched across concurrent requests."""
+
+    def __init__(self):
+        self.preprocessor = TextPreprocessor()
+        self.embedding_model = load_embedding_model()
+        self.embedding_cache = get_embedding_cache()
+        # A single model thread, batches are already as large as they get
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # SQLite lookups stay off the event loop and out of the model's queue
+        self._cache_executor = ThreadPoolExecutor(max_workers=1)
+
+    @serve.batch(
+        max_batch_size=settings.SERVE_EMBED_MAX_BATCH_SIZE,
+        batch_wait_timeout_s=settings.SERVE_EMBED_BATCH_WAIT_TIMEOUT_S,
+    )
+    async def _embed_queries(self, queries: List[str]) -> List[List[float]]:
+        return await self._encode(queries)
+
+    async def _encode(self, queries: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: self.embedding_model.encode(queries).tolist()
+        )
+
+    async def _cache_get(self, queries: List[str]) -> List[Optional[List[float]]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._cache_executor, self.embedding_cache.get_many, queries
+        )
+
+    async def _cache_put(self, queries: List[str], embeddings: List[List[float]]):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._cache_executor, self.embedding_cache.put_many, queries, embeddings
+        )
+
+    async def embed(self, query: str) -> List[float]:
+        processed_query = self.preprocessor.preprocess(query)
+        if self.embedding_cache is not None:
+            cached = (await self._cache_get([processed_query]))[0]
+            if cached is not None:
+                return cached
+        embedding = await self._embed_queries(processed_query)
+        if self.embedding_cache is not None:
+            await self._cache_put([processed_query], [embedding])
+        return embedding
+
+    def get_stats(self) -> Dict[str, Any]:
+        if self.embedding_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.embedding_cache.get_stats()}
+
+    async def embed_many(self, queries: List[str]) -> List[List[float]]:
+        """Embeds a list of queries in one forward pass."""
+        processed = self.preprocessor.preprocess_many(queries)
+        if self.embedding_cache is None:
+            return await self._encode(processed)
+        embeddings = await self._cache_get(processed)
+        missing = list({q for q, e in zip(processed, embeddings) if e is None})
+        if missing:
+            encoded = dict(zip(missing, await self._encode(missing)))
+            await self._cache_put(missing, [encoded[q] for q in missing])
+            embeddings = [
+                encoded[q] if e is None else e for q, e in zip(processed, embeddings)
+            ]
+        return embeddings
@@ -0,0 +1,156 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from qdrant_client.http import models
+from ray import serve
+import torch
+
+from schema.base import Context, RerankMode
+from settings import settings
+from utils.inference import load_reranker_model
+
+
+@serve.deployment(ray_actor_options={"num_cpus": 1})
+class Reranker:
+    """Scores contexts with the cross-encoder, batched across concurrent requests.
+
+    Only the top RERANK_BUDGET candidates by vector score are reranked (fewer and
+    truncated harder in "fast" mode) and returned, so a reranked request gets at
+    most min(num_contexts, budget) contexts, all scored by the cross-encoder. Pairs
+    are scored in sub-batches of similar length so that padding stays small.
+    """
+
+    def __init__(self):
+        self.reranker_tokenizer, self.reranker_model = load_reranker_model()
+        # A single model thread, batches are already as large as they get
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _score_pairs(
+        self, query_paragraph_pair: List[List[str]], max_length: int
+    ) -> List[float]:
+        with torch.no_grad():
+            inputs = self.reranker_tokenizer(query_paragraph_pair, padding=True, truncation=True, return_tensors='pt', max_length=max_length)
+            scores = self.reranker_model(**inputs, return_dict=True).logits.view(-1, ).float()
+        return scores.tolist()
+
+    def _score_sorted(self, pairs: List[Tuple[str, str, int]]) -> List[float]:
+        # Group by truncation length, then by text length, to minimise padding
+        order = sorted(
+            range(len(pairs)),
+            key=lambda i: (pairs[i][2], len(pairs[i][0]) + len(pairs[i][1])),
+        )
+        scores = [0.0] * len(pairs)
+        i = 0
+        while i < len(order):
+            max_length = pairs[order[i]][2]
+            sub_batch = []
+            while (
+                i < len(order)
+                and len(sub_batch) < settings.RERANK_SUB_BATCH_SIZE
+                and pairs[order[i]][2] == max_length
+            ):
+                sub_batch.append(order[i])
+                i += 1
+            sub_scores = self._score_pairs(
+                [[pairs[j][0], pairs[j][1]] for j in sub_batch], max_length
+            )
+            for j, score in zip(sub_batch, sub_scores):
+                scores[j] = score
+        return scores
+
+    async def _score_requests(
+        self, requests: List[Tuple[str, List[str], int]]
+    ) -> List[List[float]]:
+        # The (query, paragraph) pairs of all requests are scored together
+        pairs = [
+            (query, text, max_length)
+            for query, texts, max_length in requests
+            for text in texts
+        ]
+        scores = await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._score_sorted, pairs
+        )
+        results, offset = [], 0
+        for _, texts, _ in requests:
+            results.append(scores[offset : offset + len(texts)])
+            offset += len(texts)
+        return results
+
+    @serve.batch(
+        max_batch_size=settings.SERVE_RERANK_MAX_BATCH_SIZE,
+        batch_wait_timeout_s=settings.SERVE_RERANK_BATCH_WAIT_TIMEOUT_S,
+    )
+    async def _rerank_batch(
+        self, requests: List[Tuple[str, List[str], int]]
+    ) -> List[List[float]]:
+        return await self._score_requests(requests)
+
+    @staticmethod
+    def _get_candidates(
+        contexts: List[models.ScoredPoint], mode: RerankMode
+    ) -> Tuple[List[models.ScoredPoint], int]:
+        if mode == "fast":
+            budget = settings.RERANK_FAST_BUDGET
+            max_length = settings.RERANK_FAST_MAX_LENGTH
+        else:
+            budget = settings.RERANK_BUDGET
+            max_length = settings.RERANK_MAX_LENGTH
+        # Candidates arrive in vector score order
+        return contexts[:budget], max_length
+
+    @staticmethod
+    def _to_contexts(
+        contexts: List[models.ScoredPoint],
+        scores: List[float],
+        score_threshold: float,
+    ) -> List[Context]:
+        # Candidates are already de-duplicated by the searcher
+        relevant_contexts = []
+        for context, score in zip(contexts, scores):
+            if score >= score_threshold:
+                relevant_contexts.append(
+                    Context(
+                        text=context.payload.get("text"),
+                        metadata=context.payload.get("metadata"),
+                        score=score,
+                    )
+                )
+        relevant_contexts.sort(key=lambda x: x.score, reverse=True)
+        return relevant_contexts
+
+    async def rerank(
+        self,
+        query: str,
+        contexts: List[models.ScoredPoint],
+        score_threshold: float = 1,
+        mode: RerankMode = "full",
+    ) -> List[Context]:
+        contexts, max_length = self._get_candidates(contexts, mode)
+        if len(contexts) == 0:
+            return []
+        texts = [context.payload.get("text") for context in contexts]
+        scores = await self._rerank_batch((query, texts, max_length))
+        return self._to_contexts(contexts, scores, score_threshold)
+
+    async def rerank_many(
+        self, requests: List[Tuple[str, List[models.ScoredPoint], float, RerankMode]]
+    ) -> List[List[Context]]:
+        """Reranks the candidates of several queries in one length-sorted pass."""
+        candidates = [
+            self._get_candidates(contexts, mode) for _, contexts, _, mode in requests
+        ]
+        scores = await self._score_requests(
+            [
+                (query, [c.payload.get("text") for c in contexts], max_length)
+                for (query, _, _, _), (contexts, max_length) in zip(
+                    requests, candidates
+                )
+            ]
+        )
+        return [
+            self._to_contexts(contexts, query_scores, score_threshold)
+            for (_, _, score_threshold, _), (contexts, _), query_scores in zip(
+                requests, candidates, scores
+            )
+        ]
@@ -0,0 +1,283 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import UnexpectedResponse
+from ray import serve
+
+from settings import settings
+from utils.collection_profiles import get_collection_profile
+from utils.qdrant import get_async_qdrant_client
+from utils.sparse import SPARSE_VECTOR_NAME, SparseEncoder
+from utils.tenancy import TenancyRouter
+
+SearchRequest = Tuple[str, List[str], List[float], int]
+
+
+@serve.deployment(ray_actor_options={"num_cpus": 0.5})
+class VectorSearcher:
+    """Searches the vector store, I/O bound so one replica serves many requests.
+
+    With hybrid search the dense and the sparse (lexical) searches run as prefetches
+    of one Qdrant query and are fused with reciprocal rank fusion, so exact
+    identifiers match even when the dense search misses them. Candidates are fetched
+    with only their text hash, de-duplicated by it, and the text and metadata are
+    then fetched for the survivors only. Queries only search the collections (and
+    with shard keys the shards) that hold their assets, see TenancyRouter. Asset ids
+    without a shard key (never ingested or deleted) are dropped from the query, as
+    Qdrant fails the whole batch on an unknown key.
+    """
+
+    def __init__(self):
+        self.vector_store_client = get_async_qdrant_client()
+        self.sparse_encoder = SparseEncoder()
+        self.search_params = get_collection_profile().get_search_params()
+        self.tenancy = TenancyRouter()
+        # Collection name -> whether it has sparse vectors, None if it is missing
+        self._hybrid: Dict[str, Optional[bool]] = {}
+        # Collection name -> (when they were listed, its shard keys)
+        self._shard_keys: Dict[str, Tuple[float, Set[str]]] = {}
+
+    async def _use_hybrid(self, collection_name: str) -> Optional[bool]:
+        # Collections created before hybrid search have no sparse vectors
+        if self._hybrid.get(collection_name) is None:
+            try:
+                collection = await self.vector_store_client.get_collection(
+                    collection_name
+                )
+            except (UnexpectedResponse, ValueError):
+                # Nothing ingested into it yet, check again next time
+                return None
+            sparse_vectors = collection.config.params.sparse_vectors or {}
+            self._hybrid[collection_name] = (
+                settings.HYBRID_SEARCH_ENABLED and SPARSE_VECTOR_NAME in sparse_vectors
+            )
+        return self._hybrid[collection_name]
+
+    async def _get_shard_keys(
+        self, collection_name: str, refresh: bool = False
+    ) -> Set[str]:
+        listed = self._shard_keys.get(collection_name)
+        ttl = settings.SEARCH_SHARD_KEYS_TTL_S
+        if refresh or listed is None or time.monotonic() - listed[0] > ttl:
+            cluster_api = self.vector_store_client.http.cluster_api
+            response = await cluster_api.collection_cluster_info(
+                collection_name=collection_name
+            )
+            listed = (time.monotonic(), self.tenancy.get_shard_keys(response.result))
+            self._shard_keys[collection_name] = listed
+        return listed[1]
+
+    async def _drop_unknown_assets(
+        self, collection_name: str, sub_requests: List[Tuple[int, SearchRequest]]
+    ) -> List[Tuple[int, SearchRequest]]:
+        shard_keys = await self._get_shard_keys(collection_name)
+        # An asset ingested since the keys were listed would otherwise come back
+        # empty, and be cached so under its new version by the query cache
+        queried = {asset_id for _, request in sub_requests for asset_id in request[1]}
+        if not queried <= shard_keys:
+            shard_keys = await self._get_shard_keys(collection_name, refresh=True)
+        kept = []
+        for i, (query, asset_ids, vector, limit) in sub_requests:
+            if not asset_ids:
+                kept.append((i, (query, asset_ids, vector, limit)))
+                continue
+            known_ids = [asset_id for asset_id in asset_ids if asset_id in shard_keys]
+            # A request none of whose assets exist has no results here
+            if known_ids:
+                kept.append((i, (query, known_ids, vector, limit)))
+        return kept
+
+    @staticmethod
+    def _get_filter(asset_ids: List[str]) -> models.Filter:
+        return models.Filter(
+            should=[
+                models.FieldCondition(
+                    key="asset_id",
+                    match=models.MatchValue(
+                        value=asset_id,
+                    ),
+                )
+                for asset_id in asset_ids
+            ]
+            if len(asset_ids) > 0
+            else None,
+        )
+
+    def _get_query_request(
+        self,
+        query: str,
+        vector: List[float],
+        query_filter: models.Filter,
+        shard_key: Optional[List[str]],
+        limit: int,
+    ) -> models.QueryRequest:
+        indices, values = self.sparse_encoder.encode_query(query)
+        return models.QueryRequest(
+            prefetch=[
+                models.Prefetch(
+                    query=vector,
+                    filter=query_filter,
+                    params=self.search_params,
+                    limit=limit,
+                ),
+                models.Prefetch(
+                    query=models.SparseVector(indices=indices, values=values),
+                    using=SPARSE_VECTOR_NAME,
+                    filter=query_filter,
+                    limit=limit,
+                ),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            shard_key=shard_key,
+            with_payload=["text_hash"],
+            with_vector=False,
+            limit=limit,
+        )
+
+    async def _query_collection(
+        self, collection_name: str, requests: List[SearchRequest], hybrid: bool
+    ) -> List[List[models.ScoredPoint]]:
+        if not hybrid:
+            return await self.vector_store_client.search_batch(
+                collection_name=collection_name,
+                requests=[
+                    models.SearchRequest(
+                        vector=vector,
+                        filter=self._get_filter(asset_ids),
+                        params=self.search_params,
+                        shard_key=self.tenancy.get_shard_key_selector(asset_ids),
+                        with_payload=["text_hash"],
+                        with_vector=False,
+                        limit=limit,
+                    )
+                    for _, asset_ids, vector, limit in requests
+                ],
+            )
+        responses = await self.vector_store_client.query_batch_points(
+            collection_name=collection_name,
+            requests=[
+                self._get_query_request(
+                    query,
+                    vector,
+                    self._get_filter(asset_ids),
+                    self.tenancy.get_shard_key_selector(asset_ids),
+                    limit,
+                )
+                for query, asset_ids, vector, limit in requests
+            ],
+        )
+        return [response.points for response in responses]
+
+    async def _query_many(
+        self, requests: List[SearchRequest]
+    ) -> Tuple[List[List[models.ScoredPoint]], Dict[Any, str]]:
+        """Splits every request over the collections holding its assets, runs one
+        batch per collection concurrently and merges the results by score.
+
+        Returns the results and the collection of every point.
+        """
+        routed: Dict[str, List[Tuple[int, SearchRequest]]] = {}
+        for i, (query, asset_ids, vector, limit) in enumerate(requests):
+            for collection_name, routed_ids in self.tenancy.route(asset_ids).items():
+                # get more elements to remove duplicates
+                sub_request = (
+                    query,
+                    routed_ids,
+                    vector,
+                    limit * settings.SEARCH_OVERFETCH_FACTOR,
+                )
+                routed.setdefault(collection_name, []).append((i, sub_request))
+
+        collection_names, batches = [], []
+        for collection_name, sub_requests in routed.items():
+            hybrid = await self._use_hybrid(collection_name)
+            if hybrid is None:
+                continue
+            if self.tenancy.strategy == "shard_key":
+                sub_requests = await self._drop_unknown_assets(
+                    collection_name, sub_requests
+                )
+                routed[collection_name] = sub_requests
+                if not sub_requests:
+                    continue
+            collection_names.append(collection_name)
+            batches.append(
+                self._query_collection(
+                    collection_name, [r for _, r in sub_requests], hybrid
+                )
+            )
+
+        results: List[List[models.ScoredPoint]] = [[] for _ in requests]
+        point_collections: Dict[Any, str] = {}
+        for collection_name, points in zip(
+            collection_names, await asyncio.gather(*batches)
+        ):
+            for (i, _), collections in zip(routed[collection_name], points):
+                results[i].extend(collections)
+                for c in collections:
+                    point_collections[c.id] = collection_name
+        if len(routed) > 1:
+            for collections in results:
+                collections.sort(key=lambda c: c.score, reverse=True)
+        return results, point_collections
+
+    @staticmethod
+    def _dedupe(
+        collections: List[models.ScoredPoint], limit: int
+    ) -> List[models.ScoredPoint]:
+        unique = []
+        seen_hashes = set()
+        for c in collections:
+            # Points stored before text_hash existed are never treated as duplicates
+            text_hash = (c.payload or {}).get("text_hash") or c.id
+            if text_hash not in seen_hashes:
+                seen_hashes.add(text_hash)
+                unique.append(c)
+            if len(unique) == limit:
+                break
+        return unique
+
+    async def _fetch_payloads(
+        self, points: List[models.ScoredPoint], point_collections: Dict[Any, str]
+    ):
+        ids_by_collection: Dict[str, set] = {}
+        for c in points:
+            ids_by_collection.setdefault(point_collections[c.id], set()).add(c.id)
+        if not ids_by_collection:
+            return
+        records = await asyncio.gather(
+            *[
+                self.vector_store_client.retrieve(
+                    collection_name=collection_name,
+                    ids=list(ids),
+                    with_payload=["text", "metadata"],
+                    with_vectors=False,
+                )
+                for collection_name, ids in ids_by_collection.items()
+            ]
+        )
+        payloads = {record.id: record.payload for part in records for record in part}
+        for c in points:
+            c.payload = payloads.get(c.id, {})
+
+    async def search_many(
+        self, requests: List[SearchRequest]
+    ) -> List[List[models.ScoredPoint]]:
+        """Runs several (query, asset_ids, vector, limit) searches in one round trip
+        per collection and fetches the payloads of all their results at once."""
+        collections, point_collections = await self._query_many(requests)
+        results = [
+            self._dedupe(points, limit)
+            for points, (_, _, _, limit) in zip(collections, requests)
+        ]
+        await self._fetch_payloads(
+            [c for unique in results for c in unique], point_collections
+        )
+        return results
+
+    async def search(
+        self, query: str, asset_ids: List[str], vector: List[float], limit
+    ) -> List[models.ScoredPoint]:
+        return (await self.search_many([(query, asset_ids, vector, limit)]))[0]
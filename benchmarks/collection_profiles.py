@@ -0,0 +1,154 @@
+"""Search latency, recall and RAM footprint of each collection profile.
+
+Needs the Qdrant server from the settings; every profile gets its own temporary
+collection of random clustered vectors, deleted afterwards. Recall@k is measured
+against an exact search. RAM is estimated from what the profile keeps in memory
+(vectors, quantized vectors, HNSW graph); on-disk parts rely on the page cache.
+
+Run from the repository root:
+
+    python -m benchmarks.collection_profiles --points 50000 --queries 200
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client.http import models
+
+from settings import settings
+from utils.collection_profiles import COLLECTION_PROFILES, CollectionProfile
+from utils.qdrant import get_qdrant_client
+
+
+def make_vectors(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    vectors = centers[rng.integers(clusters, size=count)] + rng.normal(
+        scale=0.5, size=(count, dim)
+    )
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(
+        np.float32
+    )
+
+
+def estimate_ram_bytes(profile: CollectionProfile, count: int, dim: int) -> int:
+    ram = 0
+    if not profile.vectors_on_disk:
+        ram += count * dim * 4
+    if profile.quantization == "scalar" and profile.quantization_always_ram:
+        ram += count * dim
+    if profile.quantization == "product" and profile.quantization_always_ram:
+        ram += count * dim * 4 // 16
+    if not profile.hnsw_on_disk:
+        # Level 0 links dominate: 2 * m neighbours of 4 bytes per point
+        ram += count * 2 * max(profile.hnsw_m, profile.hnsw_payload_m) * 4
+    return ram
+
+
+def wait_until_green(client, collection_name: str):
+    green = models.CollectionStatus.GREEN
+    while client.get_collection(collection_name).status != green:
+        time.sleep(1)
+
+
+def run_profile(
+    client, name: str, vectors: np.ndarray, queries: np.ndarray, args
+) -> Dict[str, float]:
+    profile = COLLECTION_PROFILES[name]
+    collection_name = f"benchmark_{name}"
+    client.recreate_collection(
+        collection_name=collection_name,
+        **profile.get_create_kwargs(vectors.shape[1]),
+    )
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name="asset_id",
+        field_schema=models.PayloadSchemaType.KEYWORD,
+    )
+    client.upload_collection(
+        collection_name=collection_name,
+        vectors=vectors,
+        payload=[{"asset_id": f"asset-{i % args.assets}"} for i in range(len(vectors))],
+        ids=list(range(len(vectors))),
+        wait=True,
+    )
+    wait_until_green(client, collection_name)
+
+    search_params = profile.get_search_params()
+    results = {"ram_mb": estimate_ram_bytes(profile, *vectors.shape) / 2**20}
+    filters = {
+        "unfiltered": None,
+        "one_asset": models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="asset_id", match=models.MatchValue(value="asset-0")
+                )
+            ]
+        ),
+    }
+    for label, query_filter in filters.items():
+        latencies: List[float] = []
+        recalls: List[float] = []
+        for query in queries:
+            start = time.perf_counter()
+            found = client.search(
+                collection_name=collection_name,
+                query_vector=query.tolist(),
+                query_filter=query_filter,
+                search_params=search_params,
+                limit=args.k,
+            )
+            latencies.append(time.perf_counter() - start)
+            exact = client.search(
+                collection_name=collection_name,
+                query_vector=query.tolist(),
+                query_filter=query_filter,
+                search_params=models.SearchParams(exact=True),
+                limit=args.k,
+            )
+            expected = {point.id for point in exact}
+            recalls.append(
+                len(expected & {point.id for point in found}) / max(len(expected), 1)
+            )
+        results[f"{label}_p50_ms"] = np.percentile(latencies, 50) * 1000
+        results[f"{label}_p95_ms"] = np.percentile(latencies, 95) * 1000
+        results[f"{label}_recall"] = float(np.mean(recalls))
+
+    if not args.keep:
+        client.delete_collection(collection_name)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark collection profiles")
+    parser.add_argument("--points", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--assets", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dim", type=int, default=settings.EMBEDDING_DIMENSION)
+    parser.add_argument("--profiles", nargs="+", default=list(COLLECTION_PROFILES))
+    parser.add_argument("--keep", action="store_true", help="Keep the collections")
+    args = parser.parse_args()
+
+    # Queries come from the same clusters as the points
+    vectors = make_vectors(args.points + args.queries, args.dim, clusters=100, seed=0)
+    vectors, queries = vectors[: args.points], vectors[args.points :]
+    client = get_qdrant_client()
+
+    print(f"{args.points} points of dim {args.dim}, recall@{args.k}")
+    for name in args.profiles:
+        r = run_profile(client, name, vectors, queries, args)
+        print(
+            f"  {name:<17} ram ~{r['ram_mb']:7.1f} MB  "
+            f"unfiltered p50 {r['unfiltered_p50_ms']:6.2f} ms "
+            f"p95 {r['unfiltered_p95_ms']:6.2f} ms "
+            f"recall {r['unfiltered_recall']:.3f}  "
+            f"one asset p50 {r['one_asset_p50_ms']:6.2f} ms "
+            f"p95 {r['one_asset_p95_ms']:6.2f} ms "
+            f"recall {r['one_asset_recall']:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
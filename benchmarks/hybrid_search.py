@@ -0,0 +1,152 @@
+"""Recall and latency of dense, sparse and hybrid (RRF) search on a local fixture.
+
+The fixture corpus is this repository's own Python source, split into fixed
+windows of lines. Every function and class definition yields two queries, its
+identifier (`get_chunk_id`) and the identifier as words ("get chunk id"), and the
+relevant chunk is the one holding the definition. Everything runs in an in-memory
+Qdrant, no server needed.
+
+Run from the repository root:
+
+    python -m benchmarks.hybrid_search --k 5
+"""
+import argparse
+import os
+import re
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from settings import settings
+from utils.inference import load_embedding_model
+from utils.sparse import SPARSE_VECTOR_NAME, SparseEncoder
+from utils.text import TextPreprocessor
+
+COLLECTION = "hybrid_benchmark"
+DEFINITION = re.compile(r"^\s*(?:async\s+)?(?:def|class)\s+([A-Za-z_][A-Za-z0-9_]*)")
+SOURCE_DIRS = ["api", "jobs", "schema", "utils", "benchmarks"]
+
+
+def load_fixture(window: int) -> Tuple[List[str], List[Tuple[str, int]]]:
+    chunks, queries = [], []
+    for directory in SOURCE_DIRS:
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if not name.endswith(".py"):
+                    continue
+                with open(os.path.join(root, name)) as f:
+                    lines = f.read().splitlines()
+                for start in range(0, len(lines), window):
+                    part = lines[start : start + window]
+                    for line in part:
+                        match = DEFINITION.match(line)
+                        if match and not match.group(1).startswith("__"):
+                            identifier = match.group(1)
+                            words = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", identifier)
+                            words = words.replace("_", " ").lower()
+                            queries.append((identifier, len(chunks)))
+                            queries.append((words, len(chunks)))
+                    chunks.append("\n".join(part))
+    return chunks, queries
+
+
+def build_index(client: QdrantClient, chunks: List[str], embeddings: np.ndarray):
+    encoder = SparseEncoder()
+    client.recreate_collection(
+        collection_name=COLLECTION,
+        vectors_config=models.VectorParams(
+            size=embeddings.shape[1], distance=models.Distance.COSINE
+        ),
+        sparse_vectors_config={
+            SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                modifier=models.Modifier.IDF
+            )
+        },
+    )
+    sparse = encoder.encode_documents(chunks)
+    client.upload_points(
+        collection_name=COLLECTION,
+        points=[
+            models.PointStruct(
+                id=i,
+                vector={
+                    "": embeddings[i].tolist(),
+                    SPARSE_VECTOR_NAME: models.SparseVector(
+                        indices=sparse[i][0], values=sparse[i][1]
+                    ),
+                },
+            )
+            for i in range(len(chunks))
+        ],
+    )
+
+
+def search(
+    client: QdrantClient, mode: str, query: str, vector: List[float], k: int
+) -> List[int]:
+    indices, values = SparseEncoder().encode_query(query)
+    sparse_query = models.SparseVector(indices=indices, values=values)
+    if mode == "dense":
+        response = client.query_points(COLLECTION, query=vector, limit=k)
+    elif mode == "sparse":
+        response = client.query_points(
+            COLLECTION, query=sparse_query, using=SPARSE_VECTOR_NAME, limit=k
+        )
+    else:
+        response = client.query_points(
+            COLLECTION,
+            prefetch=[
+                models.Prefetch(query=vector, limit=k * 2),
+                models.Prefetch(
+                    query=sparse_query, using=SPARSE_VECTOR_NAME, limit=k * 2
+                ),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=k,
+        )
+    return [point.id for point in response.points]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hybrid search")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--window", type=int, default=30, help="Lines per chunk")
+    args = parser.parse_args()
+
+    chunks, queries = load_fixture(args.window)
+    print(f"{len(chunks)} chunks, {len(queries)} queries, recall@{args.k}")
+
+    preprocessor = TextPreprocessor()
+    model = load_embedding_model()
+    embeddings = np.asarray(model.encode(preprocessor.preprocess_many(chunks)))
+    query_vectors = model.encode(
+        preprocessor.preprocess_many([query for query, _ in queries])
+    ).tolist()
+
+    client = QdrantClient(":memory:")
+    build_index(client, chunks, embeddings)
+
+    results: Dict[str, Tuple[float, List[float]]] = {}
+    for mode in ["dense", "sparse", "hybrid"]:
+        hits, latencies = 0, []
+        for (query, relevant), vector in zip(queries, query_vectors):
+            start = time.perf_counter()
+            found = search(client, mode, query, vector, args.k)
+            latencies.append(time.perf_counter() - start)
+            hits += relevant in found
+        results[mode] = (hits / len(queries), latencies)
+
+    print(f"embedding model: {settings.EMBEDDING_MODEL}")
+    for mode, (recall, latencies) in results.items():
+        print(
+            f"  {mode:<7} recall {recall:.3f}  "
+            f"latency p50 {np.percentile(latencies, 50) * 1000:.2f} ms "
+            f"p95 {np.percentile(latencies, 95) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Embedding and rerank throughput per inference backend, with the drift of each
+backend against the fp32 PyTorch baseline.
+
+Run from the repository root:
+
+    python -m benchmarks.inference --texts 512 --backends torch torch-int8 onnx
+"""
+import argparse
+import random
+import time
+from typing import List, Tuple
+
+import numpy as np
+import torch
+
+from settings import settings
+from utils.inference import load_embedding_model, load_reranker_model
+
+VOCABULARY = (
+    "ingest chunk embed vector qdrant ray serve query document asset reader "
+    "pipeline batch model token index search rerank score metadata payload "
+    "the a of to and in is for on with as by"
+).split()
+
+
+def make_texts(count: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(20, 200)))
+        for _ in range(count)
+    ]
+
+
+def embed(backend: str, texts: List[str], batch_size: int) -> Tuple[np.ndarray, float]:
+    model = load_embedding_model(backend=backend)
+    model.encode(texts[:batch_size], batch_size=batch_size)  # warm up
+    start = time.perf_counter()
+    embeddings = np.asarray(model.encode(texts, batch_size=batch_size))
+    return embeddings, len(texts) / (time.perf_counter() - start)
+
+
+def rerank(
+    backend: str, pairs: List[List[str]], batch_size: int
+) -> Tuple[np.ndarray, float]:
+    tokenizer, model = load_reranker_model(backend=backend)
+
+    def score(batch: List[List[str]]) -> List[float]:
+        with torch.no_grad():
+            inputs = tokenizer(
+                batch,
+                padding=True,
+                truncation=True,
+                return_tensors="pt",
+                max_length=settings.RERANK_MAX_LENGTH,
+            )
+            return model(**inputs, return_dict=True).logits.view(-1).float().tolist()
+
+    score(pairs[:batch_size])  # warm up
+    start = time.perf_counter()
+    scores = []
+    for i in range(0, len(pairs), batch_size):
+        scores.extend(score(pairs[i : i + batch_size]))
+    return np.asarray(scores), len(pairs) / (time.perf_counter() - start)
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference backends")
+    parser.add_argument("--texts", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument(
+        "--backends", nargs="+", default=["torch", "torch-int8", "onnx"]
+    )
+    args = parser.parse_args()
+
+    texts = make_texts(args.texts)
+    pairs = [[" ".join(text.split()[:8]), text] for text in texts]
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+
+    print(f"embedding: {settings.EMBEDDING_MODEL}")
+    baseline = None
+    for backend in backends:
+        embeddings, rate = embed(backend, texts, args.batch_size)
+        if baseline is None:
+            baseline = embeddings
+        drift = 1 - cosine(baseline, embeddings)
+        print(
+            f"  {backend:<11} {rate:8.1f} texts/s  "
+            f"cosine drift mean {drift.mean():.2e} max {drift.max():.2e}"
+        )
+
+    print(f"reranker: {settings.RERANKER_MODEL}")
+    baseline = None
+    for backend in backends:
+        scores, rate = rerank(backend, pairs, args.batch_size)
+        if baseline is None:
+            baseline = scores
+        drift = np.abs(baseline - scores)
+        # How often the backend keeps the baseline's order of neighbouring pairs
+        agreement = np.mean(np.sign(np.diff(baseline)) == np.sign(np.diff(scores)))
+        print(
+            f"  {backend:<11} {rate:8.1f} pairs/s  "
+            f"score drift mean {drift.mean():.2e} max {drift.max():.2e}  "
+            f"order agreement {agreement:.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Ingestion startup cost: cold import time per stage and time to first chunk.
+
+The import part starts a fresh interpreter per stage and times importing the
+modules that stage's worker loads. With `--ray` it also starts cold Chunker and
+Embedder actors on a local Ray instance and times how long it takes until the
+first batch of this repository's own source comes out embedded (and, with
+`--store`, upserted into the Qdrant server from the settings).
+
+Run from the repository root:
+
+    python -m benchmarks.startup --repeat 3 --ray
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Modules each stage's worker imports when its actor or task starts
+STAGES: Dict[str, List[str]] = {
+    "service": ["jobs.service"],
+    "driver": ["jobs.ingestion.job", "jobs.ingestion.vectorstore"],
+    "reader": ["jobs.ingestion.job", "jobs.ingestion.reader"],
+    "chunker": ["jobs.ingestion.job", "jobs.ingestion.splitter"],
+    "embedder": ["jobs.ingestion.job", "sentence_transformers"],
+    "vectorstore": ["jobs.ingestion.vectorstore"],
+}
+SOURCE_DIRS = ["api", "jobs", "schema", "utils"]
+
+
+def time_imports(modules: List[str]) -> float:
+    code = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        f"import {', '.join(modules)}\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def load_docs(limit: int) -> List:
+    from jobs.ingestion.ids import get_doc_id
+    from schema.base import Document
+
+    docs = []
+    for directory in SOURCE_DIRS:
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                if not name.endswith(".py") or len(docs) >= limit:
+                    continue
+                path = os.path.join(root, name)
+                with open(path) as f:
+                    text = f.read()
+                doc_id = get_doc_id("startup-benchmark", path)
+                docs.append(
+                    Document(
+                        asset_id="startup-benchmark",
+                        doc_id=doc_id,
+                        text=text,
+                        metadata={"file_path": path},
+                        filename=name,
+                        filepath=path,
+                        content_hash="startup-benchmark",
+                        uploaded_by="benchmark",
+                        status="Read",
+                    )
+                )
+    return docs
+
+
+def time_first_chunk(docs: List, store: bool) -> Dict[str, float]:
+    import ray
+
+    from jobs.ingestion.job import Chunker, Embedder
+
+    timings = {}
+    start = time.perf_counter()
+    # Fresh actors rather than the warm pools, so every run is a cold start
+    chunker, embedder = Chunker.remote(), Embedder.remote()
+    ray.get(chunker.__ray_ready__.remote())
+    timings["chunker ready"] = time.perf_counter() - start
+    chunked = chunker.chunk_docs.remote(docs)
+    embedded = embedder.embed_chunks.remote(chunked)
+    ray.get(embedder.__ray_ready__.remote())
+    timings["embedder ready"] = time.perf_counter() - start
+    ray.wait([embedded])
+    timings["first chunk embedded"] = time.perf_counter() - start
+    actors = [chunker, embedder]
+    if store:
+        from jobs.ingestion.vectorstore import VectorStoreClient
+
+        vectorstore = VectorStoreClient.remote()
+        actors.append(vectorstore)
+        ray.get(vectorstore.store_chunks_in_vector_db.remote(embedded))
+        ray.get(vectorstore.flush.remote())
+        timings["first chunk stored"] = time.perf_counter() - start
+        ray.get(vectorstore.delete_asset.remote("startup-benchmark"))
+    for actor in actors:
+        ray.kill(actor)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion startup")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES))
+    parser.add_argument(
+        "--ray", action="store_true", help="Also time cold actors to first chunk"
+    )
+    parser.add_argument(
+        "--store", action="store_true", help="Include the upsert (needs Qdrant)"
+    )
+    parser.add_argument("--docs", type=int, default=16)
+    parser.add_argument(
+        "--runtime-package",
+        action="store_true",
+        help="Run the actors in the ingestion service's runtime env",
+    )
+    args = parser.parse_args()
+
+    print(f"cold import time, median of {args.repeat}")
+    for stage in args.stages:
+        times = [time_imports(STAGES[stage]) for _ in range(args.repeat)]
+        print(f"  {stage:<12} {statistics.median(times) * 1000:8.0f} ms")
+
+    if not args.ray:
+        return
+
+    import ray
+
+    from utils.runtime_env import get_runtime_env
+
+    docs = load_docs(args.docs)
+    runtime_env = get_runtime_env() if args.runtime_package else None
+    ray.init(runtime_env=runtime_env)
+    print(f"time to first chunk, {len(docs)} docs, median of {args.repeat}")
+    runs = [time_first_chunk(docs, args.store) for _ in range(args.repeat)]
+    for step in runs[0]:
+        median = statistics.median(run[step] for run in runs)
+        print(f"  {step:<22} {median * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,137 @@
-from typing import Any, List
+import heapq
+import itertools
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
+import ray
 
-def run_actor_paralelly(actor, method: str, input: List[Any], num_parallel: int = 1):
-    actors = [actor.remote() for _ in range(num_parallel)]
 
-    # Dynamically get the method based on the provided method name
-    actor_methods = [getattr(actor, method, None) for actor in actors]
+class ActorScheduler:
+    """Work-stealing dispatcher over a fixed set of actors.
 
-    if any(method is None or not callable(method) for method in actor_methods):
-        raise ValueError(f"Invalid method: {method}")
+    Instead of striping the input across actors up front, every actor keeps at most
+    ``max_outstanding`` calls in flight and queued items are handed to whichever actor
+    frees up first, so a few expensive items cannot turn one actor into a straggler.
+    With ``largest_first`` the queue is drained in descending ``size`` order.
+    """
 
-    # Split the data into as many batches as actors
-    input_batches = [input[i::num_parallel] for i in range(num_parallel)]
+    def __init__(
+        self,
+        actors: List[Any],
+        method: str,
+        max_outstanding: int = 2,
+        largest_first: bool = False,
+    ):
+        self.actors = list(actors)
+        self.method = method
+        self.max_outstanding = max(1, max_outstanding)
+        self.largest_first = largest_first
 
-    # Process each actor with its corresponding batch
-    actorrefs_accumulated = []
-    for actor_method, batch in zip(actor_methods, input_batches):
-        actorrefs_accumulated.extend([actor_method.remote(item) for item in batch])
+        # Dynamically get the method based on the provided method name
+        self._methods = [getattr(actor, method, None) for actor in actors]
+        if not actors or any(m is None or not callable(m) for m in self._methods):
+            raise ValueError(f"Invalid method: {method}")
 
-    return (actorrefs_accumulated, actors)
+        self._queue: List[Tuple[float, int, float, Tuple[Any, ...]]] = []
+        self._counter = itertools.count()
+        # ref -> (actor index, item size)
+        self._outstanding: Dict[ray.ObjectRef, Tuple[int, float]] = {}
+        self._size_done = 0.0
+        self._load = [0] * len(actors)
+        self._calls = [0] * len(actors)
+        self._busy_s = [0.0] * len(actors)
+        self._busy_since: List[Optional[float]] = [None] * len(actors)
+        self._started_at = time.perf_counter()
+
+    def __len__(self) -> int:
+        """Number of items queued or running."""
+        return len(self._queue) + len(self._outstanding)
+
+    def capacity(self) -> int:
+        return self.max_outstanding * len(self.actors)
+
+    def has_capacity(self) -> bool:
+        return len(self) < self.capacity()
+
+    def add_actors(self, actors: List[Any]):
+        for actor in actors:
+            if actor in self.actors:
+                continue
+            method = getattr(actor, self.method, None)
+            if method is None or not callable(method):
+                raise ValueError(f"Invalid method: {self.method}")
+            self.actors.append(actor)
+            self._methods.append(method)
+            self._load.append(0)
+            self._calls.append(0)
+            self._busy_s.append(0.0)
+            self._busy_since.append(None)
+        self._dispatch()
+
+    def outstanding(self) -> List[ray.ObjectRef]:
+        return list(self._outstanding)
+
+    def _enqueue(self, args: Tuple[Any, ...], size: float):
+        priority = -size if self.largest_first else 0
+        heapq.heappush(self._queue, (priority, next(self._counter), size, args))
+
+    def submit(self, *args: Any, size: float = 0):
+        self._enqueue(args, size)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._queue:
+            idx = min(range(len(self.actors)), key=lambda i: self._load[i])
+            if self._load[idx] >= self.max_outstanding:
+                return
+            _, _, size, args = heapq.heappop(self._queue)
+            ref = self._methods[idx].remote(*args)
+            self._outstanding[ref] = (idx, size)
+            if self._load[idx] == 0:
+                self._busy_since[idx] = time.perf_counter()
+            self._load[idx] += 1
+            self._calls[idx] += 1
+
+    def _release(self, ref: ray.ObjectRef):
+        idx, size = self._outstanding.pop(ref)
+        self._size_done += size
+        self._load[idx] -= 1
+        if self._load[idx] == 0:
+            self._busy_s[idx] += time.perf_counter() - self._busy_since[idx]
+            self._busy_since[idx] = None
+
+    def wait(
+        self, num_returns: int = 1, timeout: Optional[float] = None
+    ) -> List[ray.ObjectRef]:
+        """Returns finished refs (without fetching them) and refills freed actors."""
+        if not self._outstanding:
+            return []
+        refs = list(self._outstanding)
+        ready, _ = ray.wait(
+            refs, num_returns=min(num_returns, len(refs)), timeout=timeout
+        )
+        for ref in ready:
+            self._release(ref)
+        self._dispatch()
+        return ready
+
+    def pop_ready(self) -> List[ray.ObjectRef]:
+        return self.wait(num_returns=len(self._outstanding), timeout=0)
+
+    def throughput(self) -> float:
+        """Size of finished items per second of actor busy time."""
+        busy = sum(stat["busy_s"] for stat in self.get_stats())
+        return self._size_done / busy if busy else 0
+
+    def get_stats(self) -> List[Dict[str, float]]:
+        now = time.perf_counter()
+        elapsed = max(now - self._started_at, 1e-9)
+        stats = []
+        for i in range(len(self.actors)):
+            busy = self._busy_s[i]
+            if self._busy_since[i] is not None:
+                busy += now - self._busy_since[i]
+            stats.append(
+                {"calls": self._calls[i], "busy_s": busy, "utilisation": busy / elapsed}
+            )
+        return stats
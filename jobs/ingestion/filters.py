@@ -0,0 +1,221 @@
+import fnmatch
+import os
+from typing import Any, Dict, Optional
+
+from schema.base import FileFilter
+from settings import settings
+
+DEFAULT_EXCLUDE_PATTERNS = [
+    # Dependencies, build output and VCS metadata
+    "node_modules/*",
+    "bower_components/*",
+    "vendor/*",
+    "dist/*",
+    "build/*",
+    "target/*",
+    ".git/*",
+    "__pycache__/*",
+    ".venv/*",
+    # Lockfiles
+    "*.lock",
+    "package-lock.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    # Bundles and generated code
+    "*.min.js",
+    "*.min.css",
+    "*.map",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+    "*.pb.go",
+    # Media, archives, fonts and compiled files
+    "*.png",
+    "*.jpg",
+    "*.jpeg",
+    "*.gif",
+    "*.ico",
+    "*.svg",
+    "*.mp3",
+    "*.mp4",
+    "*.zip",
+    "*.tar",
+    "*.gz",
+    "*.jar",
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.eot",
+    "*.pyc",
+    "*.so",
+    "*.dll",
+    "*.exe",
+    "*.class",
+    "*.o",
+]
+
+# Parsed into text by the file readers, their raw size says little about how much
+# text they hold, so the size limit only applies through an extension policy
+DOCUMENT_EXTENSIONS = {
+    "pdf",
+    "doc",
+    "docx",
+    "ppt",
+    "pptx",
+    "pptm",
+    "xls",
+    "xlsx",
+    "epub",
+    "ipynb",
+}
+
+# Code and assets that are commonly minified; prose and parsed documents are
+# allowed long lines (a paragraph per line)
+MINIFIABLE_EXTENSIONS = {
+    "js",
+    "mjs",
+    "cjs",
+    "jsx",
+    "ts",
+    "css",
+    "scss",
+    "less",
+    "json",
+    "html",
+    "htm",
+    "xml",
+    "svg",
+}
+
+GENERATED_MARKERS = [
+    "@generated",
+    "do not edit",
+    "code generated by",
+    "autogenerated",
+    "auto-generated",
+    "this file was generated",
+]
+
+# Only the start of a file is inspected by the content checks
+_SAMPLE_CHARS = 8192
+_HEADER_CHARS = 2048
+# Short one-line files (configs, small JSON) are not treated as minified
+_MINIFIED_MIN_CHARS = 1024
+
+
+def _match(path: str, pattern: str) -> bool:
+    # `*` crosses directories, the `*/` variant matches at any depth
+    return fnmatch.fnmatchcase(path, pattern) or fnmatch.fnmatchcase(
+        path, f"*/{pattern}"
+    )
+
+
+def get_extension(path: str) -> str:
+    return os.path.splitext(path)[1].lstrip(".").lower()
+
+
+class FileFilterStage:
+    """Decides which files of an asset are worth chunking and embedding.
+
+    Path globs, extension policies and sizes are checked on the listing, before a
+    file is fetched; binary, minified and generated files are detected on the
+    loaded text. Documents (PDF, Office, ...) are only size-limited by an extension
+    policy and only code and asset files are checked for minification. Kept and
+    skipped files and bytes are counted per reason.
+    """
+
+    def __init__(self, config: Optional[FileFilter] = None):
+        self.config = config or FileFilter()
+        self.include = [pattern.lower() for pattern in self.config.include]
+        self.exclude = [pattern.lower() for pattern in self.config.exclude]
+        if self.config.default_excludes:
+            self.exclude += DEFAULT_EXCLUDE_PATTERNS
+        self.extensions = {
+            ext.lstrip(".").lower(): policy
+            for ext, policy in self.config.extensions.items()
+        }
+        self.max_file_bytes = (
+            self.config.max_file_bytes or settings.READER_MAX_FILE_BYTES
+        )
+        self.files_kept = 0
+        self.bytes_kept = 0
+        self.files_skipped = 0
+        self.bytes_skipped = 0
+        self.skipped_by_reason: Dict[str, int] = {}
+
+    def check_path(self, path: str, size: Optional[int] = None) -> Optional[str]:
+        """Returns why the file should be skipped, or None to fetch it."""
+        lowered = path.lower()
+        policy = self.extensions.get(get_extension(path))
+        if policy is not None and policy.skip:
+            return "extension"
+        if self.include and not any(_match(lowered, p) for p in self.include):
+            return "not_included"
+        if any(_match(lowered, p) for p in self.exclude):
+            return "excluded"
+        max_bytes = self.max_file_bytes
+        if get_extension(path) in DOCUMENT_EXTENSIONS:
+            max_bytes = None
+        if policy is not None and policy.max_file_bytes is not None:
+            max_bytes = policy.max_file_bytes
+        if size is not None and max_bytes is not None and size > max_bytes:
+            return "too_large"
+        return None
+
+    def _is_binary(self, sample: str) -> bool:
+        if "\x00" in sample:
+            return True
+        # Undecodable bytes and control characters other than whitespace
+        junk = sum(
+            1
+            for char in sample
+            if char == "\ufffd" or (ord(char) < 32 and char not in "\t\n\r\f\v")
+        )
+        return junk > len(sample) * 0.1
+
+    def _is_minified(self, text: str) -> bool:
+        if len(text) < _MINIFIED_MIN_CHARS:
+            return False
+        lines = text.count("\n") + 1
+        return len(text) / lines > settings.READER_MINIFIED_LINE_LENGTH
+
+    def _is_generated(self, text: str) -> bool:
+        header = text[:_HEADER_CHARS].lower()
+        return any(marker in header for marker in GENERATED_MARKERS)
+
+    def check_content(self, path: str, text: str) -> Optional[str]:
+        """Returns why the loaded file should be skipped, or None to keep it."""
+        if not text.strip():
+            return "empty"
+        policy = self.extensions.get(get_extension(path))
+        if policy is not None and not policy.check_content:
+            return None
+        if self.config.skip_binary and self._is_binary(text[:_SAMPLE_CHARS]):
+            return "binary"
+        if (
+            self.config.skip_minified
+            and get_extension(path) in MINIFIABLE_EXTENSIONS
+            and self._is_minified(text)
+        ):
+            return "minified"
+        if self.config.skip_generated and self._is_generated(text):
+            return "generated"
+        return None
+
+    def keep(self, size: int):
+        self.files_kept += 1
+        self.bytes_kept += size
+
+    def skip(self, reason: str, size: int = 0):
+        self.files_skipped += 1
+        self.bytes_skipped += size
+        self.skipped_by_reason[reason] = self.skipped_by_reason.get(reason, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "files_kept": self.files_kept,
+            "bytes_kept": self.bytes_kept,
+            "files_skipped": self.files_skipped,
+            "bytes_skipped": self.bytes_skipped,
+            "files_skipped_by_reason": dict(self.skipped_by_reason),
+        }
+
@@ -0,0 +1,19 @@
+import uuid
+
+from settings import settings
+
+# Deterministic ids: the same file of the same asset always maps to the same doc_id
+ID_NAMESPACE = uuid.UUID("6f1c8a8e-6a43-4c61-9a56-0b1e3b0f4d2a")
+
+
+def get_doc_id(asset_id: str, file_path: str, index: int = 0) -> str:
+    return str(uuid.uuid5(ID_NAMESPACE, f"{asset_id}/{file_path}#{index}"))
+
+
+def get_chunking_version() -> str:
+    # The same content splits into different chunks under other chunking settings
+    return f"chunking-{settings.CHUNK_SIZE}-{settings.CHUNK_OVERLAP}"
+
+
+def get_chunk_id(doc_id: str, content_hash: str, ordinal: int) -> str:
+    return str(uuid.uuid5(ID_NAMESPACE, f"{doc_id}/{content_hash}/{ordinal}"))
@@ -1,22 +1,30 @@
 import argparse
+import asyncio
+import itertools
 import json
+import time
 import uuid
-from typing import List, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import ray
-from llama_index.text_splitter import CodeSplitter, SentenceSplitter
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
-from qdrant_client.http.exceptions import UnexpectedResponse
-from sentence_transformers import SentenceTransformer
-from stop_words import get_stop_words
-from tqdm import tqdm
-from transformers import AutoModel
-
-from jobs.batcher import run_actor_paralelly
-from jobs.ingestion.reader import get_reader
-from schema.base import Chunk, Document, GithubIngestionPayload, S3IngestionPayload
+
+from jobs.ingestion.ids import get_chunk_id
+from jobs.ingestion.pipeline import StreamingIngestionPipeline
+from jobs.pool import get_actor_pools
+from schema.base import (
+    ChunkBatch,
+    Document,
+    GithubIngestionPayload,
+    S3IngestionPayload,
+)
 from settings import settings
+from utils.asset_versions import get_asset_versions
+from utils.embedding_cache import get_embedding_cache
+from utils.inference import load_embedding_model
+from utils.sparse import SparseEncoder
+from utils.text import TextPreprocessor
 
 
 @ray.remote(
@@ -25,18 +33,68 @@ from settings import settings
 )
 class Reader:
     def __init__(self):
-        pass
+        self._reader = None
+        self._docs = None
+        self._pending = None
+
+    def _get_reader(self, payload: Union[GithubIngestionPayload, S3IngestionPayload]):
+        # Source clients and parsers are only imported by the reader actors
+        from jobs.ingestion.reader import get_reader
 
-    def read_docs(self, payload: Union[GithubIngestionPayload, S3IngestionPayload]):
-        reader = get_reader(
+        return get_reader(
             asset_type=payload.asset_type,
             asset_id=payload.asset_id,
             owner=payload.owner,
             kwargs=payload.reader_kwargs,
             extra_metadata=payload.extra_metadata,
         )
-        documents = reader.load()
-        return documents
+
+    def open(
+        self,
+        payload: Union[GithubIngestionPayload, S3IngestionPayload],
+        batch_size: int = settings.INGESTION_READ_BATCH_SIZE,
+        previous_manifest: Optional[Dict[str, str]] = None,
+        shard: int = 0,
+        num_shards: int = 1,
+    ):
+        self._reader = self._get_reader(payload)
+        batches = self._reader.iter_load(
+            batch_size, previous_manifest, shard, num_shards
+        )
+        self._docs = itertools.chain.from_iterable(batches)
+        self._pending = None
+
+    def get_manifest(self) -> Dict[str, str]:
+        # Complete once read_batch has signalled the end of the asset
+        return self._reader.manifest
+
+    def get_filter_stats(self) -> Dict[str, Any]:
+        return self._reader.filter.get_stats()
+
+    @ray.method(num_returns=2)
+    def read_batch(
+        self, max_bytes: int = settings.INGESTION_CHUNK_BATCH_BYTES
+    ) -> Tuple[List[Document], Optional[Dict[str, int]]]:
+        """Packs documents into a batch of about `max_bytes` of text.
+
+        The batch and a small summary are returned as separate objects so the
+        driver can route the batch without fetching it. The summary is None once
+        the asset is exhausted.
+        """
+        docs, size = [], 0
+        while True:
+            doc = self._pending or next(self._docs, None)
+            self._pending = None
+            if doc is None:
+                break
+            if docs and size + len(doc.text) > max_bytes:
+                self._pending = doc
+                break
+            docs.append(doc)
+            size += len(doc.text)
+        if not docs:
+            return [], None
+        return docs, {"docs": len(docs), "bytes": size}
 
 
 @ray.remote(
@@ -45,91 +103,37 @@ class Reader:
 )
 class Chunker:
     def __init__(self):
-        self.supported_languages = {
-            ".bash": "bash",
-            ".c": "c",
-            ".cs": "c-sharp",
-            ".lisp": "commonlisp",
-            ".cpp": "cpp",
-            ".css": "css",
-            ".dockerfile": "dockerfile",
-            ".dot": "dot",
-            ".elisp": "elisp",
-            ".ex": "elixir",
-            ".elm": "elm",
-            ".et": "embedded-template",
-            ".erl": "erlang",
-            ".f": "fixed-form-fortran",
-            ".f90": "fortran",
-            ".go": "go",
-            ".mod": "go-mod",
-            ".hack": "hack",
-            ".hs": "haskell",
-            ".hcl": "hcl",
-            ".html": "html",
-            ".java": "java",
-            ".js": "javascript",
-            ".jsdoc": "jsdoc",
-            ".json": "json",
-            ".jl": "julia",
-            ".kt": "kotlin",
-            ".lua": "lua",
-            ".mk": "make",
-            ".md": "markdown",
-            ".m": "objc",
-            ".ml": "ocaml",
-            ".pl": "perl",
-            ".php": "php",
-            ".py": "python",
-            ".ql": "ql",
-            ".r": "r",
-            ".regex": "regex",
-            ".rst": "rst",
-            ".rb": "ruby",
-            ".rs": "rust",
-            ".scala": "scala",
-            ".sql": "sql",
-            ".sqlite": "sqlite",
-            ".toml": "toml",
-            ".tsq": "tsq",
-            ".tsx": "typescript",
-            ".ts": "typescript",
-            ".yaml": "yaml",
-        }
+        # Splitters (llama-index, tree-sitter) are only imported by the chunkers
+        from jobs.ingestion.splitter import SplitterCache
 
-    def chunk_doc(
+        self.splitters = SplitterCache()
+
+    def chunk_docs(
         self,
-        doc: Document,
+        docs: List[Document],
         chunk_size=settings.CHUNK_SIZE,
         chunk_overlap=settings.CHUNK_OVERLAP,
-    ) -> List[Chunk]:
-        ext = doc.filename.split(".")[-1] if doc.filename else "generic"
-        language = self.supported_languages.get(ext)
-
-        text_splitter = None
-        if language:
-            text_splitter = CodeSplitter(
-                language=language,
-                max_chars=chunk_size,
-                chunk_lines_overlap=chunk_overlap,
+    ) -> ChunkBatch:
+        from jobs.ingestion.splitter import get_language
+
+        batch = ChunkBatch(asset_id=docs[0].asset_id if docs else "")
+        for doc in docs:
+            language = get_language(doc.filename)
+            text_splits = self.splitters.split(
+                doc.text, language, chunk_size, chunk_overlap
             )
-        else:
-            text_splitter = SentenceSplitter(
-                chunk_size=chunk_size,
-                chunk_overlap=chunk_overlap,
-            )
-
-        text_splits = text_splitter.split_text(doc.text)
-        return [
-            Chunk(
-                chunk_id=str(uuid.uuid4()),
-                asset_id=doc.asset_id,
-                doc_id=doc.doc_id,
-                text=text,
-                metadata=doc.metadata,
-            )
-            for text in text_splits
-        ]
+            if not text_splits:
+                continue
+            batch.metadata[doc.doc_id] = doc.metadata
+            batch.filepaths[doc.doc_id] = doc.filepath
+            batch.content_hashes[doc.doc_id] = doc.content_hash
+            for ordinal, text in enumerate(text_splits):
+                # Re-ingesting unchanged content overwrites the same points
+                chunk_id = get_chunk_id(doc.doc_id, doc.content_hash, ordinal)
+                batch.chunk_ids.append(chunk_id)
+                batch.doc_ids.append(doc.doc_id)
+                batch.texts.append(text)
+        return batch
 
 
 @ray.remote(
@@ -137,105 +141,152 @@ class Chunker:
     num_gpus=0,
 )
 class Embedder:
-    def __init__(self):
-        self.stop_words = get_stop_words("en")
-        if settings.USE_SENTENCE_TRANSFORMERS:
-            self.embed_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-        else:
-            self.embed_model = AutoModel.from_pretrained(
-                settings.EMBEDDING_MODEL, trust_remote_code=True
-            )
-
-    def _remove_stopwords(self, text: str) -> str:
-        return " ".join([word for word in text.split() if word not in self.stop_words])
-
-    def embed_chunks_batch(
-        self, chunks: List[Chunk], batch_size: int = 10
-    ) -> List[Chunk]:
-        chunk_texts = [self._remove_stopwords(chunk.text) for chunk in chunks]
-        embeddings = self.embed_model.encode(
-            chunk_texts,
-            batch_size=batch_size,
-        ).tolist()
-        assert len(chunk_texts) == len(embeddings)
-        for chunk, embedding in zip(chunks, embeddings):
-            chunk.embeddings = embedding
-        return chunks
+    """Long-lived embedder that micro-batches chunks across concurrent calls.
 
+    Every call enqueues its chunks; a background loop collects up to
+    EMBEDDING_MAX_BATCH_SIZE chunks (waiting at most EMBEDDING_BATCH_WAIT_TIMEOUT_S
+    for more to arrive), sorts them by length and encodes them in sub-batches whose
+    padded size stays within EMBEDDING_BATCH_CHAR_BUDGET.
+    """
 
-@ray.remote(
-    num_cpus=1,
-    num_gpus=0,
-)
-class VectorStoreClient:
     def __init__(self):
-        self.vectorstore_client = QdrantClient(
-            url=settings.QDRANT_BASE_URI,
-            api_key=settings.QDRANT_API_KEY,
-            https=settings.QDRANT_USE_HTTPS,
-        )
-        self._dim = settings.EMBEDDING_DIMENSION
-        self._collection_name = settings.VECTOR_DB_COLLECTION_NAME
-        self._create_collection_if_not_exists()
-
-    def _create_collection_if_not_exists(self):
-        try:
-            self.vectorstore_client.get_collection(self._collection_name)
-        except (UnexpectedResponse, ValueError):
-            self.vectorstore_client.create_collection(
-                collection_name=self._collection_name,
-                vectors_config=models.VectorParams(
-                    size=self._dim, distance=models.Distance.COSINE, on_disk=True
-                ),
-                on_disk_payload=True,
-                hnsw_config=models.HnswConfigDiff(payload_m=16, m=0, on_disk=True),
+        self.preprocessor = TextPreprocessor()
+        self.embed_model = load_embedding_model()
+        self.sparse_encoder = SparseEncoder()
+        self.embedding_cache = get_embedding_cache()
+        # Encoding runs off the event loop so new chunks keep queueing meanwhile
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._queue: Optional[asyncio.Queue] = None
+        self.chunks_embedded = 0
+        self.encode_s = 0.0
+        # asset id -> [cache hits, cache misses] of its chunks, until collected
+        self._cache_counts: Dict[str, List[int]] = {}
+
+    def _split_by_budget(self, texts: List[str], order: List[int]) -> List[List[int]]:
+        # `order` is sorted by length, so the last text of a sub-batch is its longest
+        sub_batches, current = [], []
+        for i in order:
+            padded_size = (len(current) + 1) * len(texts[i])
+            if current and padded_size > settings.EMBEDDING_BATCH_CHAR_BUDGET:
+                sub_batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            sub_batches.append(current)
+        return sub_batches
+
+    def _encode_uncached(self, texts: List[str]) -> np.ndarray:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = None
+        for sub_batch in self._split_by_budget(texts, order):
+            encoded = self.embed_model.encode(
+                [texts[i] for i in sub_batch],
+                batch_size=len(sub_batch),
             )
-            self._create_asset_id_index()
-
-    def _create_asset_id_index(self):
-        self.vectorstore_client.create_payload_index(
-            collection_name=self._collection_name,
-            field_name="asset_id",
-            field_schema=models.PayloadSchemaType.KEYWORD,
-        )
-
-    def _get_batch_points(self, chunk_batch: List[List[Chunk]]):
-        ids = []
-        payloads = []
-        vectors = []
-
-        for batch in chunk_batch:
-            for chunk in batch:
-                ids.append(chunk.chunk_id)
-                vectors.append(chunk.embeddings)
-                payloads.append(
-                    {
-                        "doc_id": chunk.doc_id,
-                        "asset_id": chunk.asset_id,
-                        "metadata": json.dumps(chunk.metadata),
-                        "text": chunk.text,
-                    }
+            if embeddings is None:
+                embeddings = np.empty((len(texts), encoded.shape[1]), np.float32)
+            embeddings[sub_batch] = encoded
+        return embeddings
+
+    def _encode(self, texts: List[str]) -> Tuple[np.ndarray, List[bool]]:
+        """Returns the embeddings and whether each one came from the cache."""
+        start = time.perf_counter()
+        if self.embedding_cache is None:
+            embeddings = self._encode_uncached(texts)
+            hits = [False] * len(texts)
+        else:
+            cached = self.embedding_cache.get_many(texts)
+            # Identical texts within a batch are encoded once
+            missing = list({text for text, e in zip(texts, cached) if e is None})
+            encoded = {}
+            if missing:
+                vectors = self._encode_uncached(missing)
+                self.embedding_cache.put_many(missing, vectors)
+                encoded = dict(zip(missing, vectors))
+            embeddings = np.asarray(
+                [encoded[text] if e is None else e for text, e in zip(texts, cached)],
+                dtype=np.float32,
+            )
+            hits = [e is not None for e in cached]
+        self.encode_s += time.perf_counter() - start
+        self.chunks_embedded += len(texts)
+        return embeddings, hits
+
+    async def _next_batch(self) -> List[Tuple[str, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + settings.EMBEDDING_BATCH_WAIT_TIMEOUT_S
+        while len(batch) < settings.EMBEDDING_MAX_BATCH_SIZE:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                embeddings, hits = await loop.run_in_executor(
+                    self._executor, self._encode, texts
                 )
-
-        return [ids, payloads, vectors]
-
-    def store_chunks_in_vector_db(self, chunks_batches: List[List[Chunk]]):
-        points_batch = self._get_batch_points(chunks_batches)
-        self.vectorstore_client.upload_collection(
-            collection_name=self._collection_name,
-            vectors=points_batch[2],
-            payload=points_batch[1],
-            ids=points_batch[0],
-            parallel=20,
-            wait=True,
-        )
-        return True
-
-
-def with_tqdm_iterator(obj_ids):
-    while obj_ids:
-        done, obj_ids = ray.wait(obj_ids)
-        yield ray.get(done[0])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), embedding, hit in zip(batch, embeddings, hits):
+                if not future.done():
+                    future.set_result((embedding, hit))
+
+    async def embed_chunks(self, batch: ChunkBatch) -> ChunkBatch:
+        if len(batch) == 0:
+            return batch
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            asyncio.get_running_loop().create_task(self._batch_loop())
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in self.preprocessor.preprocess_many(batch.texts):
+            future = loop.create_future()
+            self._queue.put_nowait((text, future))
+            futures.append(future)
+        if settings.HYBRID_SEARCH_ENABLED:
+            # Lexical vectors use the raw text, identifiers must survive as they are
+            batch.set_sparse_vectors(self.sparse_encoder.encode_documents(batch.texts))
+        results = await asyncio.gather(*futures)
+        batch.embeddings = np.stack([embedding for embedding, _ in results])
+        if self.embedding_cache is not None:
+            # Batches of other jobs share the micro-batches, so hits are counted
+            # per call and kept per asset (an asset has one job at a time)
+            hits = sum(1 for _, hit in results if hit)
+            counts = self._cache_counts.setdefault(batch.asset_id, [0, 0])
+            counts[0] += hits
+            counts[1] += len(results) - hits
+        return batch
+
+    async def pop_cache_counts(self, asset_id: str) -> Tuple[int, int]:
+        """Cache hits and misses of the asset's chunks since the last call."""
+        hits, misses = self._cache_counts.pop(asset_id, [0, 0])
+        return hits, misses
+
+    async def get_stats(self) -> Dict[str, Any]:
+        return {
+            "cache": self.embedding_cache.get_stats() if self.embedding_cache else {},
+            "chunks_embedded": self.chunks_embedded,
+            "encode_s": self.encode_s,
+            "chunks_per_s": (
+                self.chunks_embedded / self.encode_s if self.encode_s else 0
+            ),
+        }
 
 
 # Please note that setting num_cpus=0 means that the task or actor can run on a node even if no CPUs are available.
@@ -243,44 +294,46 @@ def with_tqdm_iterator(obj_ids):
 # resources when it runs.
 @ray.remote(num_cpus=0.25)
 def ingest_asset(payload: Union[GithubIngestionPayload, S3IngestionPayload]):
-    NUM_WORKERS = settings.INGESTION_WORKERS_PER_JOB
-
-    # Read documents
-    reader = Reader.remote()
-    docs = ray.get(reader.read_docs.remote(payload))
-    del reader  # delete actor to free space
-
-    # Chunk the docs in parallel
-    (chunks_refs, actors) = run_actor_paralelly(Chunker, "chunk_doc", docs, NUM_WORKERS)
-    chunks = [
-        chunk for chunk in tqdm(with_tqdm_iterator(chunks_refs), total=len(chunks_refs))
-    ]
-    flat_chunks = [item for sublist in chunks for item in sublist]
-    # delete actors to free up cpu allocation
-    for actor in actors:
-        ray.kill(actor)
-
-    # Embed the chunks again in parallel
-    batch_size, batches = 2, []
-    for i in range(0, len(flat_chunks), batch_size):
-        batch = flat_chunks[i : i + batch_size]
-        batches.append(batch)
-    (embed_refs, actors) = run_actor_paralelly(
-        Embedder, "embed_chunks_batch", batches, NUM_WORKERS
-    )
-    embedded_chunks = [
-        chunk for chunk in tqdm(with_tqdm_iterator(embed_refs), total=len(embed_refs))
-    ]
-    flat_chunks = [item for sublist in chunks for item in sublist]
-    # delete actors to free up cpu allocation
-    for actor in actors:
-        ray.kill(actor)
-
-    # Save the chunk in vectorstore
-    vectorstore = VectorStoreClient.remote()
-    result = vectorstore.store_chunks_in_vector_db.remote(embedded_chunks)
-    ray.get(result)
-    del vectorstore
+    # The Qdrant client is only imported by the job driver and the store actor
+    from jobs.ingestion.vectorstore import VectorStoreClient
+
+    started_at = time.perf_counter()
+    job_id = uuid.uuid4().hex
+
+    pools = get_actor_pools()
+    readers, vectorstore = [], None
+    try:
+        # Chunkers and embedders come from warm pools shared with other jobs. The
+        # leases are released below even if the job is cancelled while acquiring
+        chunkers = ray.get(pools.acquire.remote("chunker", job_id))
+        embedders = ray.get(pools.acquire.remote("embedder", job_id))
+        # Large assets can be split across several readers by file
+        readers = [Reader.remote() for _ in range(settings.INGESTION_READER_SHARDS)]
+        vectorstore = VectorStoreClient.remote()
+
+        pipeline = StreamingIngestionPipeline(
+            payload=payload,
+            readers=readers,
+            chunkers=chunkers,
+            embedders=embedders,
+            vectorstore=vectorstore,
+            pools=pools,
+            job_id=job_id,
+            started_at=started_at,
+        )
+        stats = pipeline.run()
+    finally:
+        for pool in ("chunker", "embedder"):
+            pools.release.remote(pool, job_id)
+        # Cached retrieval results for this asset are stale, even after a failure
+        # some chunks may have been written
+        get_asset_versions().bump.remote(payload.asset_id)
+        # delete actors to free up cpu allocation
+        for actor in [*readers, vectorstore]:
+            if actor is not None:
+                ray.kill(actor)
+
+    return stats
 
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import ray
+
+from jobs.batcher import ActorScheduler
+from schema.base import GithubIngestionPayload, IngestionStats, S3IngestionPayload
+from settings import settings
+
+
+class StreamingIngestionPipeline:
+    """Streams documents read -> chunk -> embed -> upsert.
+
+    Every stage holds at most a bounded number of calls in flight and a reader is
+    only asked for the next batch once the chunkers, the embedders and the vector
+    store all have room for it, so peak memory depends on the queue depths rather
+    than on the size of the asset, and all stages run concurrently. Intermediate
+    results are handed from stage to stage as object refs, so documents, chunks and
+    embeddings never pass through the driver.
+
+    Documents are packed into batches by total text size. The size starts at
+    INGESTION_CHUNK_BATCH_BYTES and follows the measured chunking throughput so that
+    one chunk_docs call takes about INGESTION_CHUNK_BATCH_TARGET_S. With several
+    readers, each reads its own shard of the asset's files and they are asked for
+    batches in turn, one outstanding batch per reader.
+    """
+
+    def __init__(
+        self,
+        payload: Union[GithubIngestionPayload, S3IngestionPayload],
+        readers: List[Any],
+        chunkers: List[Any],
+        embedders: List[Any],
+        vectorstore: Any,
+        read_batch_size: int = settings.INGESTION_READ_BATCH_SIZE,
+        max_in_flight: int = settings.INGESTION_MAX_IN_FLIGHT,
+        pools: Optional[Any] = None,
+        job_id: Optional[str] = None,
+        started_at: Optional[float] = None,
+    ):
+        self.payload = payload
+        self.readers = list(readers)
+        self.vectorstore = vectorstore
+        self.read_batch_size = read_batch_size
+        self.pools = pools
+        self.job_id = job_id
+        # perf_counter() when the job started, before its actors were set up
+        self.started_at = started_at
+        self.batch_bytes = settings.INGESTION_CHUNK_BATCH_BYTES
+        self._last_report = time.perf_counter()
+
+        self.chunk_stage = ActorScheduler(
+            chunkers,
+            "chunk_docs",
+            settings.INGESTION_MAX_OUTSTANDING_PER_ACTOR,
+            largest_first=settings.INGESTION_LARGEST_FIRST,
+        )
+        self.embed_stage = ActorScheduler(
+            embedders, "embed_chunks", settings.INGESTION_MAX_OUTSTANDING_PER_ACTOR
+        )
+        self.store_stage = ActorScheduler(
+            [vectorstore],
+            "store_chunks_in_vector_db",
+            max(max_in_flight, settings.QDRANT_UPSERT_CONCURRENCY),
+        )
+
+        self.stats = IngestionStats(asset_id=payload.asset_id)
+
+    def _all_refs(
+        self, read_refs: Dict[int, List[ray.ObjectRef]]
+    ) -> List[ray.ObjectRef]:
+        return (
+            self.chunk_stage.outstanding()
+            + self.embed_stage.outstanding()
+            + self.store_stage.outstanding()
+            + [refs[1] for refs in read_refs.values()]
+        )
+
+    def _next_batch_bytes(self) -> int:
+        throughput = self.chunk_stage.throughput()
+        if throughput:
+            target = int(throughput * settings.INGESTION_CHUNK_BATCH_TARGET_S)
+            self.batch_bytes = min(
+                max(target, settings.INGESTION_CHUNK_BATCH_MIN_BYTES),
+                settings.INGESTION_CHUNK_BATCH_MAX_BYTES,
+            )
+        return self.batch_bytes
+
+    def _chunk_queue_full(self, pending_reads: int = 0) -> bool:
+        # Keep a few batches queued beyond the running ones so a freed chunker
+        # picks up work immediately and largest-first has something to order
+        queued = len(self.chunk_stage) + pending_reads
+        return queued >= self.chunk_stage.capacity() + len(self.chunk_stage.actors)
+
+    def _report_queue_depths(self, chunked_refs: List[ray.ObjectRef]):
+        # Lets the shared pools autoscale and hands this job any actors they added
+        now = time.perf_counter()
+        if self.pools is None:
+            return
+        if now - self._last_report < settings.INGESTION_POOL_REPORT_INTERVAL_S:
+            return
+        self._last_report = now
+        depths = {
+            "chunker": (self.chunk_stage, len(self.chunk_stage)),
+            "embedder": (self.embed_stage, len(self.embed_stage) + len(chunked_refs)),
+        }
+        for pool, (stage, depth) in depths.items():
+            actors = ray.get(
+                self.pools.report_queue_depth.remote(pool, self.job_id, depth)
+            )
+            stage.add_actors(actors)
+
+    def actor_stats(self) -> Dict[str, List[Dict[str, float]]]:
+        return {
+            "chunk": self.chunk_stage.get_stats(),
+            "embed": self.embed_stage.get_stats(),
+            "store": self.store_stage.get_stats(),
+        }
+
+    def run(self) -> IngestionStats:
+        start = time.perf_counter()
+        job_start = self.started_at if self.started_at is not None else start
+        self.stats.startup_s = start - job_start
+        embed_start, embed_end = None, None
+        store_start = None
+        asset_id = self.payload.asset_id
+
+        # Unchanged files are skipped unless a full re-ingestion is requested
+        stored_manifest = ray.get(self.vectorstore.get_manifest.remote(asset_id))
+        previous_manifest = stored_manifest if self.payload.incremental else None
+        for shard, reader in enumerate(self.readers):
+            reader.open.remote(
+                self.payload,
+                self.read_batch_size,
+                previous_manifest,
+                shard,
+                len(self.readers),
+            )
+
+        # reader index -> [docs_ref, summary_ref] of its outstanding batch
+        read_refs: Dict[int, List[ray.ObjectRef]] = {}
+        readers_done = set()
+        next_reader = 0
+        chunked_refs: List[ray.ObjectRef] = []
+        embedded_refs: List[ray.ObjectRef] = []
+
+        while True:
+            # Upserted batches
+            for ref in self.store_stage.pop_ready():
+                self.stats.chunks_stored += ray.get(ref)
+                if not self.stats.first_chunk_s and self.stats.chunks_stored:
+                    self.stats.first_chunk_s = time.perf_counter() - job_start
+
+            # Embedded batches go to the vector store without passing through the driver
+            ready = self.embed_stage.pop_ready()
+            if ready:
+                embed_end = time.perf_counter()
+                embedded_refs.extend(ready)
+            while embedded_refs and self.store_stage.has_capacity():
+                if store_start is None:
+                    store_start = time.perf_counter()
+                self.store_stage.submit(embedded_refs.pop(0))
+
+            # Chunk batches stream into the embedders, which batch them across calls,
+            # as long as the embedded batches waiting for the vector store fit in it
+            chunked_refs.extend(self.chunk_stage.pop_ready())
+            while (
+                chunked_refs
+                and self.embed_stage.has_capacity()
+                and len(embedded_refs) < self.store_stage.capacity()
+            ):
+                if embed_start is None:
+                    embed_start = time.perf_counter()
+                self.embed_stage.submit(chunked_refs.pop(0))
+
+            # Only pull more documents when downstream has drained enough
+            for idx, (docs_ref, summary_ref) in list(read_refs.items()):
+                if not ray.wait([summary_ref], timeout=0)[0]:
+                    continue
+                summary = ray.get(summary_ref)
+                del read_refs[idx]
+                if summary is None:
+                    readers_done.add(idx)
+                else:
+                    self.stats.docs_read += summary["docs"]
+                    self.chunk_stage.submit(docs_ref, size=summary["bytes"])
+            for offset in range(len(self.readers)):
+                if (
+                    self._chunk_queue_full(len(read_refs))
+                    or len(chunked_refs) >= self.embed_stage.capacity()
+                    or len(embedded_refs) >= self.store_stage.capacity()
+                ):
+                    break
+                # Round robin over the readers that are idle and not exhausted
+                idx = (next_reader + offset) % len(self.readers)
+                if idx in read_refs or idx in readers_done:
+                    continue
+                read_refs[idx] = self.readers[idx].read_batch.remote(
+                    self._next_batch_bytes()
+                )
+                next_reader = (idx + 1) % len(self.readers)
+            docs_done = len(readers_done) == len(self.readers)
+
+            self._report_queue_depths(chunked_refs)
+            refs = self._all_refs(read_refs)
+            if not refs and not chunked_refs and not embedded_refs:
+                if docs_done:
+                    break
+                continue
+            if refs:
+                ray.wait(refs, num_returns=1)
+
+        # Upserts do not wait for indexing, the manifest is only saved once all
+        # points of this run are applied
+        ray.get(self.vectorstore.flush.remote())
+        if store_start is not None:
+            self.stats.store_elapsed_s = time.perf_counter() - store_start
+
+        # Every reader lists the whole asset but only drops the files of its own
+        # shard that the content filters reject
+        manifests = ray.get([reader.get_manifest.remote() for reader in self.readers])
+        manifest = {
+            path: version
+            for path, version in manifests[0].items()
+            if all(path in other for other in manifests[1:])
+        }
+        for filter_stats in ray.get(
+            [reader.get_filter_stats.remote() for reader in self.readers]
+        ):
+            self.stats.files_kept += filter_stats["files_kept"]
+            self.stats.bytes_kept += filter_stats["bytes_kept"]
+            self.stats.files_skipped += filter_stats["files_skipped"]
+            self.stats.bytes_skipped += filter_stats["bytes_skipped"]
+            for reason, count in filter_stats["files_skipped_by_reason"].items():
+                skipped = self.stats.files_skipped_by_reason
+                skipped[reason] = skipped.get(reason, 0) + count
+        for hits, misses in ray.get(
+            [
+                embedder.pop_cache_counts.remote(asset_id)
+                for embedder in self.embed_stage.actors
+            ]
+        ):
+            self.stats.embedding_cache_hits += hits
+            self.stats.embedding_cache_misses += misses
+        self.stats.files_total = len(manifest)
+        previous = previous_manifest or {}
+        self.stats.files_changed = len(
+            [path for path, h in manifest.items() if previous.get(path) != h]
+        )
+        self.stats.files_removed = ray.get(
+            self.vectorstore.finalize.remote(asset_id, stored_manifest, manifest)
+        )
+
+        self.stats.elapsed_s = time.perf_counter() - start
+        if embed_start is not None and embed_end is not None:
+            self.stats.embed_elapsed_s = embed_end - embed_start
+        self.stats.actor_utilisation = {
+            stage: [actor["utilisation"] for actor in actors]
+            for stage, actors in self.actor_stats().items()
+        }
+        return self.stats
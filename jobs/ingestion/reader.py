@@ -1,13 +1,26 @@
-import uuid
+import base64
+import hashlib
+import os
+import tempfile
+import zlib
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Literal
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Literal, Optional
 
-from llama_hub.s3 import S3Reader
-from llama_index.readers import GithubRepositoryReader
+import boto3
+import requests
+from botocore.config import Config
+from requests.adapters import HTTPAdapter
+from llama_index import SimpleDirectoryReader
+from llama_index.schema import Document as LlamaDocument
 from pydantic import BaseModel
 
 from constants import READ_SUCCESSFULLY
-from schema.base import Document
+from jobs.ingestion.filters import FileFilterStage
+from jobs.ingestion.ids import get_chunking_version, get_doc_id
+from schema.base import Document, FileFilter
+from settings import settings
 
 
 class GithubReaderKwargs(BaseModel):
@@ -15,6 +28,7 @@ class GithubReaderKwargs(BaseModel):
     repo: str
     branch: str = "main"
     github_token: str
+    filters: FileFilter = FileFilter()
 
 
 class S3ReaderKwargs(BaseModel):
@@ -22,22 +36,109 @@ class S3ReaderKwargs(BaseModel):
     access_key: str
     secret_key: str
     endpoint: str = None
+    filters: FileFilter = FileFilter()
 
 
 AllowedAssetTypes = Literal["github", "s3"]
 AllowedReaderKwargs = GithubReaderKwargs
 
 
+def get_shard(file_path: str, num_shards: int) -> int:
+    # Stable across processes, so every reader actor agrees on the split
+    return zlib.crc32(file_path.encode("utf-8")) % num_shards
+
+
 class BaseReader(ABC):
-    def __init__(self, asset_id, owner: str, extra_metadata: Dict[str, Any]):
+    """Loads the documents of an asset.
+
+    Readers that can list their files with a content version (a git blob SHA, an S3
+    ETag) without downloading them implement `_list` and `_load_path`, so an
+    incremental load only fetches the files whose version changed. Listed files are
+    fetched and parsed by `concurrency` threads and handed out in order as they
+    finish, with a bounded number of files fetched ahead. Other readers load
+    everything and the version is a hash of the loaded text.
+
+    Changed files go through `filters` first: paths and listed sizes are checked
+    before fetching, the loaded text afterwards. Skipped files are left out of the
+    manifest, so chunks of a file that is now filtered out are removed.
+    """
+
+    def __init__(
+        self,
+        asset_id,
+        owner: str,
+        extra_metadata: Dict[str, Any],
+        concurrency: int = settings.READER_CONCURRENCY,
+        filters: Optional[FileFilter] = None,
+    ):
         self.asset_id = asset_id
         self.owner = owner
         self.extra_metadata = extra_metadata
+        self.concurrency = max(1, concurrency)
+        self.filter = FileFilterStage(filters)
+        # file path -> content hash of the files seen by the last load
+        self.manifest: Dict[str, str] = {}
+        # file path -> size in bytes, for readers whose listing includes it
+        self._sizes: Dict[str, int] = {}
+        self._docs_per_file: Dict[str, int] = {}
 
     @abstractmethod
     def _load(self) -> List[Any]:
         pass
 
+    def _list(self) -> Optional[Dict[str, str]]:
+        """Returns file path -> content version, or None if listing is unsupported."""
+        return None
+
+    def _load_path(self, path: str) -> List[Any]:
+        raise NotImplementedError
+
+    def _iter_paths(self, paths: List[str]) -> Iterator[List[Any]]:
+        """Yields the documents of each path, in order, fetching concurrently."""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = deque()
+            for path in paths:
+                pending.append(executor.submit(self._load_path, path))
+                # Bounded read-ahead keeps memory flat on large assets
+                if len(pending) >= self.concurrency * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _load_paths(self, paths: List[str]) -> List[Any]:
+        return [doc for docs in self._iter_paths(paths) for doc in docs]
+
+    def _check_path(self, path: str, read: bool, size: Optional[int] = None) -> bool:
+        """Whether a listed file passes the path and size filters. Only files this
+        load would read count towards the filter stats."""
+        size = self._sizes.get(path) if size is None else size
+        reason = self.filter.check_path(path, size)
+        if reason is not None and read:
+            self.filter.skip(reason, size or 0)
+        return reason is None
+
+    def _check_content(self, path: str, docs: List[Any]) -> bool:
+        text = "\n".join(doc.text for doc in docs)
+        size = self._sizes.get(path, len(text.encode("utf-8")))
+        reason = self.filter.check_content(path, text)
+        if reason is not None:
+            self.filter.skip(reason, size)
+            self.manifest.pop(path, None)
+            return False
+        self.filter.keep(size)
+        return True
+
+    @staticmethod
+    def _get_path(doc: Any) -> str:
+        return doc.metadata.get("file_path") or doc.metadata.get("file_name") or ""
+
+    def _hash_documents(self, documents: List[Any]) -> Dict[str, str]:
+        hashes: Dict[str, Any] = {}
+        for doc in documents:
+            path = self._get_path(doc)
+            hashes.setdefault(path, hashlib.sha256()).update(doc.text.encode("utf-8"))
+        return {path: h.hexdigest() for path, h in hashes.items()}
+
     def _add_metadata(self, documents: List[Any]) -> List[Any]:
         for doc in documents:
             doc.metadata.update(self.extra_metadata)
@@ -47,7 +148,11 @@ class BaseReader(ABC):
         documents = self._add_metadata(documents)
         doc_objects = []
         for doc in documents:
-            doc_id = str(uuid.uuid4())
+            path = self._get_path(doc)
+            # A file can produce several documents (e.g. one per PDF page)
+            index = self._docs_per_file.get(path, 0)
+            self._docs_per_file[path] = index + 1
+            doc_id = get_doc_id(self.asset_id, path, index)
             custom_doc = Document(
                 asset_id=self.asset_id,
                 doc_id=doc_id,
@@ -59,17 +164,85 @@ class BaseReader(ABC):
                     "uploaded_by": self.owner,
                 },
                 filename=doc.metadata.get("file_name"),
-                filepath=doc.metadata.get("file_path"),
+                filepath=path,
+                content_hash=self.manifest.get(path, ""),
                 uploaded_by=self.owner,
                 status=READ_SUCCESSFULLY,
             )
             doc_objects.append(custom_doc)
         return doc_objects
 
-    def load(self) -> List[Document]:
+    def iter_load(
+        self,
+        batch_size: int,
+        previous_manifest: Optional[Dict[str, str]] = None,
+        shard: int = 0,
+        num_shards: int = 1,
+    ) -> Iterator[List[Document]]:
+        """Yields batches (of up to `batch_size` files) of the documents whose
+        content differs from `previous_manifest`; `self.manifest` holds every file
+        of the asset.
+
+        With `num_shards` > 1 only the files of shard `shard` are read, so several
+        readers can split one asset.
+        """
+        previous = previous_manifest or {}
+        self._docs_per_file = {}
+        # File versions include the chunking settings, so changing them re-chunks
+        # every file and the chunks of the old versions are deleted as stale
+        chunking = get_chunking_version()
+
+        listing = self._list()
+        if listing is not None:
+            self.manifest = {}
+            changed = []
+            for path, version in listing.items():
+                version = f"{version}@{chunking}"
+                read = (
+                    previous.get(path) != version
+                    and get_shard(path, num_shards) == shard
+                )
+                if not self._check_path(path, read):
+                    continue
+                self.manifest[path] = version
+                if read:
+                    changed.append(path)
+            batch, files = [], 0
+            for path, docs in zip(changed, self._iter_paths(changed)):
+                if not self._check_content(path, docs):
+                    continue
+                batch.extend(docs)
+                files += 1
+                if files == batch_size:
+                    yield self._transform(batch)
+                    batch, files = [], 0
+            if batch:
+                yield self._transform(batch)
+            return
+
+        # Without a listing the first shard reads everything
+        if shard != 0:
+            return
         docs = self._load()
-        docs = self._transform(docs)
-        return docs
+        hashes = {
+            path: f"{content_hash}@{chunking}"
+            for path, content_hash in self._hash_documents(docs).items()
+        }
+        docs_by_path: Dict[str, List[Any]] = {}
+        for doc in docs:
+            docs_by_path.setdefault(self._get_path(doc), []).append(doc)
+        self.manifest = {}
+        changed = []
+        for path, path_docs in docs_by_path.items():
+            read = previous.get(path) != hashes[path]
+            size = sum(len(doc.text.encode("utf-8")) for doc in path_docs)
+            if not self._check_path(path, read, size):
+                continue
+            self.manifest[path] = hashes[path]
+            if read and self._check_content(path, path_docs):
+                changed.extend(path_docs)
+        for i in range(0, len(changed), batch_size):
+            yield self._transform(changed[i : i + batch_size])
 
 
 class GitHubReader(BaseReader):
@@ -80,14 +253,80 @@ class GitHubReader(BaseReader):
         kwargs: GithubReaderKwargs,
         extra_metadata: Dict[str, Any] = {},
     ):
-        super().__init__(asset_id, owner, extra_metadata)
+        super().__init__(asset_id, owner, extra_metadata, filters=kwargs.filters)
         self.branch = kwargs.branch
-        self.reader = GithubRepositoryReader(
-            owner=kwargs.owner, repo=kwargs.repo, github_token=kwargs.github_token
+        self.repo_url = f"{settings.GITHUB_API_URL}/repos/{kwargs.owner}/{kwargs.repo}"
+        # One pooled connection per fetching thread
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.concurrency, pool_maxsize=self.concurrency
         )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Accept": "application/vnd.github+json",
+                "Authorization": f"Bearer {kwargs.github_token}",
+            }
+        )
+        self._blob_shas: Dict[str, str] = {}
+
+    def _get_tree(self, tree_sha: str, recursive: bool) -> Dict[str, Any]:
+        response = self.session.get(
+            f"{self.repo_url}/git/trees/{tree_sha}",
+            params={"recursive": "1"} if recursive else None,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _list_blobs(self, tree_sha: str, prefix: str = "") -> List[Dict[str, Any]]:
+        # The recursive tree gives every file's blob SHA without downloading it
+        tree = self._get_tree(tree_sha, recursive=True)
+        if not tree.get("truncated"):
+            return [
+                {**entry, "path": f"{prefix}{entry['path']}"}
+                for entry in tree["tree"]
+                if entry["type"] == "blob"
+            ]
+        # Too large for one response, list this level and each subtree on its own
+        tree = self._get_tree(tree_sha, recursive=False)
+        if tree.get("truncated"):
+            raise ValueError(
+                f"Directory {prefix or '/'} of {self.repo_url} is too large to list"
+            )
+        blobs = []
+        for entry in tree["tree"]:
+            path = f"{prefix}{entry['path']}"
+            if entry["type"] == "blob":
+                blobs.append({**entry, "path": path})
+            elif entry["type"] == "tree":
+                blobs.extend(self._list_blobs(entry["sha"], f"{path}/"))
+        return blobs
+
+    def _list(self) -> Dict[str, str]:
+        blobs = self._list_blobs(self.branch)
+        self._blob_shas = {entry["path"]: entry["sha"] for entry in blobs}
+        self._sizes = {entry["path"]: entry["size"] for entry in blobs}
+        return dict(self._blob_shas)
+
+    def _fetch_blob(self, sha: str) -> str:
+        response = self.session.get(f"{self.repo_url}/git/blobs/{sha}")
+        response.raise_for_status()
+        content = base64.b64decode(response.json()["content"])
+        # Binary files decode to replacement characters and are filtered out
+        return content.decode("utf-8", errors="replace")
+
+    def _load_path(self, path: str) -> List[LlamaDocument]:
+        text = self._fetch_blob(self._blob_shas[path])
+        return [
+            LlamaDocument(
+                text=text,
+                metadata={"file_path": path, "file_name": os.path.basename(path)},
+            )
+        ]
 
     def _load(self):
-        return self.reader.load_data(branch=self.branch)
+        return self._load_paths(list(self._list()))
 
 
 class S3ContainerReader(BaseReader):
@@ -98,16 +337,44 @@ class S3ContainerReader(BaseReader):
         kwargs: S3ReaderKwargs,
         extra_metadata: Dict[str, Any] = {},
     ):
-        super().__init__(asset_id, owner, extra_metadata)
-        self.reader = S3Reader(
-            bucket=kwargs.bucket_name,
-            aws_access_id=kwargs.access_key,
-            aws_access_secret=kwargs.secret_key,
-            s3_endpoint_url=kwargs.endpoint,
+        super().__init__(asset_id, owner, extra_metadata, filters=kwargs.filters)
+        self.bucket = kwargs.bucket_name
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=kwargs.access_key,
+            aws_secret_access_key=kwargs.secret_key,
+            endpoint_url=kwargs.endpoint,
+            # One pooled connection per fetching thread
+            config=Config(max_pool_connections=self.concurrency),
         )
 
+    def _list(self) -> Dict[str, str]:
+        # ETags change whenever an object's content changes
+        listing = {}
+        self._sizes = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket):
+            for obj in page.get("Contents", []):
+                if not obj["Key"].endswith("/"):
+                    listing[obj["Key"]] = obj["ETag"].strip('"')
+                    self._sizes[obj["Key"]] = obj["Size"]
+        return listing
+
+    def _load_path(self, key: str) -> List[LlamaDocument]:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # The local name keeps the extension, which selects the file parser
+            local_path = os.path.join(temp_dir, f"object{os.path.splitext(key)[1]}")
+            self.client.download_file(self.bucket, key, local_path)
+            return SimpleDirectoryReader(
+                input_files=[local_path],
+                file_metadata=lambda path: {
+                    "file_path": key,
+                    "file_name": os.path.basename(key),
+                },
+            ).load_data()
+
     def _load(self):
-        return self.reader.load_data()
+        return self._load_paths(list(self._list()))
 
 
 def get_reader(
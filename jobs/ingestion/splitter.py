@@ -0,0 +1,149 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.text_splitter import CodeSplitter, SentenceSplitter
+
+SUPPORTED_LANGUAGES = {
+    ".bash": "bash",
+    ".c": "c",
+    ".cs": "c-sharp",
+    ".lisp": "commonlisp",
+    ".cpp": "cpp",
+    ".css": "css",
+    ".dockerfile": "dockerfile",
+    ".dot": "dot",
+    ".elisp": "elisp",
+    ".ex": "elixir",
+    ".elm": "elm",
+    ".et": "embedded-template",
+    ".erl": "erlang",
+    ".f": "fixed-form-fortran",
+    ".f90": "fortran",
+    ".go": "go",
+    ".mod": "go-mod",
+    ".hack": "hack",
+    ".hs": "haskell",
+    ".hcl": "hcl",
+    ".html": "html",
+    ".java": "java",
+    ".js": "javascript",
+    ".jsdoc": "jsdoc",
+    ".json": "json",
+    ".jl": "julia",
+    ".kt": "kotlin",
+    ".lua": "lua",
+    ".mk": "make",
+    ".md": "markdown",
+    ".m": "objc",
+    ".ml": "ocaml",
+    ".pl": "perl",
+    ".php": "php",
+    ".py": "python",
+    ".ql": "ql",
+    ".r": "r",
+    ".regex": "regex",
+    ".rst": "rst",
+    ".rb": "ruby",
+    ".rs": "rust",
+    ".scala": "scala",
+    ".sql": "sql",
+    ".sqlite": "sqlite",
+    ".toml": "toml",
+    ".tsq": "tsq",
+    ".tsx": "typescript",
+    ".ts": "typescript",
+    ".yaml": "yaml",
+}
+
+# Files that are identified by name rather than by extension
+SPECIAL_FILENAMES = {
+    "dockerfile": "dockerfile",
+    "makefile": "make",
+}
+
+
+def get_language(filename: Optional[str]) -> Optional[str]:
+    if not filename:
+        return None
+    basename = os.path.basename(filename).lower()
+    if basename in SPECIAL_FILENAMES:
+        return SPECIAL_FILENAMES[basename]
+    ext = os.path.splitext(basename)[1]
+    return SUPPORTED_LANGUAGES.get(ext)
+
+
+class SplitterCache:
+    """Builds one splitter per (language, chunk_size, chunk_overlap) and reuses it,
+    together with one tree-sitter parser per language, for the owner's lifetime."""
+
+    def __init__(self):
+        self._code_splitters: Dict[Tuple[str, int, int], CodeSplitter] = {}
+        self._sentence_splitters: Dict[Tuple[int, int], SentenceSplitter] = {}
+        self._parsers: Dict[str, object] = {}
+
+    def _get_parser(self, language: str):
+        if language not in self._parsers:
+            import tree_sitter_languages
+
+            try:
+                self._parsers[language] = tree_sitter_languages.get_parser(language)
+            except Exception:
+                self._parsers[language] = None
+        if self._parsers[language] is None:
+            raise ValueError(f"No tree-sitter parser for language {language}.")
+        return self._parsers[language]
+
+    def get_code_splitter(
+        self, language: str, chunk_size: int, chunk_overlap: int
+    ) -> CodeSplitter:
+        key = (language, chunk_size, chunk_overlap)
+        if key not in self._code_splitters:
+            self._code_splitters[key] = CodeSplitter(
+                language=language,
+                max_chars=chunk_size,
+                chunk_lines_overlap=chunk_overlap,
+            )
+        return self._code_splitters[key]
+
+    def get_sentence_splitter(
+        self, chunk_size: int, chunk_overlap: int
+    ) -> SentenceSplitter:
+        key = (chunk_size, chunk_overlap)
+        if key not in self._sentence_splitters:
+            self._sentence_splitters[key] = SentenceSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+            )
+        return self._sentence_splitters[key]
+
+    def _split_code(
+        self, text: str, language: str, chunk_size: int, chunk_overlap: int
+    ) -> List[str]:
+        splitter = self.get_code_splitter(language, chunk_size, chunk_overlap)
+        # CodeSplitter.split_text builds a new parser on every call, so walk the
+        # tree ourselves with the cached parser. _chunk_node is private to the
+        # pinned llama-index; if it changes, fall back to the public split_text
+        tree = self._get_parser(language).parse(bytes(text, "utf-8"))
+        root = tree.root_node
+        if root.children and root.children[0].type == "ERROR":
+            raise ValueError(f"Could not parse code with language {language}.")
+        try:
+            chunks = splitter._chunk_node(root, text)
+        except (AttributeError, TypeError):
+            return splitter.split_text(text)
+        return [chunk.strip() for chunk in chunks]
+
+    def split(
+        self,
+        text: str,
+        language: Optional[str],
+        chunk_size: int,
+        chunk_overlap: int,
+    ) -> List[str]:
+        if language:
+            try:
+                return self._split_code(text, language, chunk_size, chunk_overlap)
+            except ValueError:
+                # Unparseable code is still worth indexing as plain text
+                pass
+        return self.get_sentence_splitter(chunk_size, chunk_overlap).split_text(text)
@@ -0,0 +1,286 @@
+import json
+import uuid
+from typing import Any, Dict, List, Optional
+
+import ray
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+from schema.base import ChunkBatch
+from settings import settings
+from utils.collection_profiles import get_collection_profile
+from utils.qdrant import get_qdrant_client
+from utils.sparse import SPARSE_VECTOR_NAME
+from utils.tenancy import TenancyRouter
+from utils.text import get_text_hash
+
+# Chunk ids are uuid5, so no point ever has the nil UUID
+_BARRIER_POINT_ID = str(uuid.UUID(int=0))
+
+
+@ray.remote(
+    num_cpus=1,
+    num_gpus=0,
+    max_concurrency=settings.QDRANT_UPSERT_CONCURRENCY,
+)
+class VectorStoreClient:
+    """Upserts embedded batches as they arrive.
+
+    Up to QDRANT_UPSERT_CONCURRENCY batches are written concurrently, in requests
+    of QDRANT_UPSERT_BATCH_SIZE points that do not wait for indexing. `flush` is
+    the consistency barrier at the end of a job.
+    """
+
+    def __init__(self):
+        self.vectorstore_client = get_qdrant_client()
+        self.tenancy = TenancyRouter()
+        # Assets written to since the last flush
+        self._pending_assets = set()
+        self._dim = settings.EMBEDDING_DIMENSION
+        self._collection_name = settings.VECTOR_DB_COLLECTION_NAME
+        self._manifest_collection_name = f"{self._collection_name}_manifests"
+        # Collection name -> whether it has sparse vectors to write
+        self._hybrid: Dict[str, bool] = {}
+        self._shard_keys = set()
+        for collection_name in self.tenancy.get_collection_names():
+            self._create_collection_if_not_exists(collection_name)
+        self._create_manifest_collection_if_not_exists()
+
+    def _create_collection_if_not_exists(self, collection_name: str):
+        try:
+            info = self.vectorstore_client.get_collection(collection_name)
+        except (UnexpectedResponse, ValueError):
+            self.vectorstore_client.create_collection(
+                collection_name=collection_name,
+                sparse_vectors_config={
+                    SPARSE_VECTOR_NAME: models.SparseVectorParams(
+                        index=models.SparseIndexParams(on_disk=True),
+                        modifier=models.Modifier.IDF,
+                    )
+                },
+                **self.tenancy.get_create_kwargs(),
+                **get_collection_profile().get_create_kwargs(self._dim),
+            )
+            self._create_asset_id_index(collection_name)
+            self._create_filepath_index(collection_name)
+            info = self.vectorstore_client.get_collection(collection_name)
+        # Collections created before hybrid search have no sparse vector to write
+        self._hybrid[collection_name] = settings.HYBRID_SEARCH_ENABLED and (
+            SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+        )
+
+    def _create_asset_id_index(self, collection_name: str):
+        self.vectorstore_client.create_payload_index(
+            collection_name=collection_name,
+            field_name="asset_id",
+            field_schema=self.tenancy.get_asset_id_index_schema(),
+        )
+
+    def _create_filepath_index(self, collection_name: str):
+        self.vectorstore_client.create_payload_index(
+            collection_name=collection_name,
+            field_name="filepath",
+            field_schema=models.PayloadSchemaType.KEYWORD,
+        )
+
+    def _create_manifest_collection_if_not_exists(self):
+        try:
+            self.vectorstore_client.get_collection(self._manifest_collection_name)
+        except (UnexpectedResponse, ValueError):
+            # One payload-only point per asset, the vector is a placeholder
+            self.vectorstore_client.create_collection(
+                collection_name=self._manifest_collection_name,
+                vectors_config=models.VectorParams(
+                    size=1, distance=models.Distance.DOT
+                ),
+            )
+
+    def _get_manifest_point_id(self, asset_id: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"manifest/{asset_id}"))
+
+    def get_manifest(self, asset_id: str) -> Optional[Dict[str, str]]:
+        """File path -> content hash of the last completed ingestion, if any."""
+        points = self.vectorstore_client.retrieve(
+            collection_name=self._manifest_collection_name,
+            ids=[self._get_manifest_point_id(asset_id)],
+            with_payload=True,
+        )
+        if not points:
+            return None
+        return json.loads(points[0].payload["files"])
+
+    def _save_manifest(self, asset_id: str, manifest: Dict[str, str]):
+        self.vectorstore_client.upsert(
+            collection_name=self._manifest_collection_name,
+            points=[
+                models.PointStruct(
+                    id=self._get_manifest_point_id(asset_id),
+                    vector=[0.0],
+                    payload={"asset_id": asset_id, "files": json.dumps(manifest)},
+                )
+            ],
+            wait=True,
+        )
+
+    def _ensure_shard_key(self, asset_id: str):
+        if asset_id not in self._shard_keys:
+            self.tenancy.create_shard_key(self.vectorstore_client, asset_id)
+            self._shard_keys.add(asset_id)
+
+    def _delete_asset_points(self, asset_id: str, *conditions: models.Condition):
+        # A first ingestion that stored nothing has not created the key yet
+        self._ensure_shard_key(asset_id)
+        self.vectorstore_client.delete(
+            collection_name=self.tenancy.get_collection_name(asset_id),
+            shard_key_selector=self.tenancy.get_shard_key(asset_id),
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="asset_id", match=models.MatchValue(value=asset_id)
+                        ),
+                        *conditions,
+                    ]
+                )
+            ),
+            wait=True,
+        )
+
+    def finalize(
+        self,
+        asset_id: str,
+        previous_manifest: Optional[Dict[str, str]],
+        manifest: Dict[str, str],
+        batch_size: int = 256,
+    ) -> int:
+        """Deletes chunks of removed or changed files and records the new manifest.
+
+        Runs after all new chunks are stored and flushed. Returns the number of
+        removed files.
+        """
+        if previous_manifest is None:
+            # Chunks written before manifests existed carry no content hash
+            self._delete_asset_points(
+                asset_id,
+                models.IsEmptyCondition(
+                    is_empty=models.PayloadField(key="content_hash")
+                ),
+            )
+        stale = [
+            (path, content_hash)
+            for path, content_hash in (previous_manifest or {}).items()
+            if manifest.get(path) != content_hash
+        ]
+        for i in range(0, len(stale), batch_size):
+            self._delete_asset_points(
+                asset_id,
+                models.Filter(
+                    should=[
+                        models.Filter(
+                            must=[
+                                models.FieldCondition(
+                                    key="filepath", match=models.MatchValue(value=path)
+                                ),
+                                models.FieldCondition(
+                                    key="content_hash",
+                                    match=models.MatchValue(value=content_hash),
+                                ),
+                            ]
+                        )
+                        for path, content_hash in stale[i : i + batch_size]
+                    ]
+                ),
+            )
+        self._save_manifest(asset_id, manifest)
+        return len([path for path in previous_manifest or {} if path not in manifest])
+
+    def delete_asset(self, asset_id: str):
+        """Removes all chunks and the manifest of an asset; with shard keys this
+        drops the asset's shard instead of deleting point by point."""
+        self.tenancy.delete_asset(self.vectorstore_client, asset_id)
+        self.vectorstore_client.delete(
+            collection_name=self._manifest_collection_name,
+            points_selector=models.PointIdsList(
+                points=[self._get_manifest_point_id(asset_id)]
+            ),
+            wait=True,
+        )
+
+    def _get_batch_payloads(self, batch: ChunkBatch) -> List[Dict[str, Any]]:
+        # Serialize each document's metadata once, however many chunks it has
+        metadata = {
+            doc_id: json.dumps(meta) for doc_id, meta in batch.metadata.items()
+        }
+        return [
+            {
+                "doc_id": doc_id,
+                "asset_id": batch.asset_id,
+                "metadata": metadata[doc_id],
+                "text": text,
+                "text_hash": get_text_hash(text),
+                "filepath": batch.filepaths[doc_id],
+                "content_hash": batch.content_hashes[doc_id],
+            }
+            for doc_id, text in zip(batch.doc_ids, batch.texts)
+        ]
+
+    def _get_batch_vectors(self, batch: ChunkBatch, start: int, end: int):
+        # Vectors stay numpy arrays until here, only the slice being sent is
+        # converted to the lists the client expects
+        dense = batch.embeddings[start:end].tolist()
+        collection_name = self.tenancy.get_collection_name(batch.asset_id)
+        if not self._hybrid[collection_name] or batch.sparse_offsets is None:
+            return dense
+        return {
+            "": dense,
+            SPARSE_VECTOR_NAME: [
+                models.SparseVector(indices=indices, values=values)
+                for indices, values in batch.get_sparse_vectors(start, end)
+            ],
+        }
+
+    def _upsert(self, asset_id: str, points: models.Batch, wait: bool):
+        self.vectorstore_client.upsert(
+            collection_name=self.tenancy.get_collection_name(asset_id),
+            points=points,
+            shard_key_selector=self.tenancy.get_shard_key(asset_id),
+            wait=wait,
+        )
+
+    def store_chunks_in_vector_db(
+        self, batch: ChunkBatch, batch_size: int = settings.QDRANT_UPSERT_BATCH_SIZE
+    ) -> int:
+        if len(batch) == 0:
+            return 0
+        self._ensure_shard_key(batch.asset_id)
+        payloads = self._get_batch_payloads(batch)
+        for i in range(0, len(batch), batch_size):
+            points = models.Batch(
+                ids=batch.chunk_ids[i : i + batch_size],
+                vectors=self._get_batch_vectors(batch, i, i + batch_size),
+                payloads=payloads[i : i + batch_size],
+            )
+            self._upsert(batch.asset_id, points, wait=False)
+        self._pending_assets.add(batch.asset_id)
+        return len(batch)
+
+    def flush(self):
+        """Waits until every upsert issued so far has been applied.
+
+        Qdrant applies the updates of a shard in order, and an update that selects
+        points by filter is sent to every shard (of the asset's shard key). A delete
+        by a filter that matches no point, with wait=True, therefore returns once
+        every earlier write to each of those shards is applied.
+        """
+        for asset_id in list(self._pending_assets):
+            self.vectorstore_client.delete(
+                collection_name=self.tenancy.get_collection_name(asset_id),
+                points_selector=models.FilterSelector(
+                    filter=models.Filter(
+                        must=[models.HasIdCondition(has_id=[_BARRIER_POINT_ID])]
+                    )
+                ),
+                shard_key_selector=self.tenancy.get_shard_key(asset_id),
+                wait=True,
+            )
+            self._pending_assets.discard(asset_id)
@@ -0,0 +1,67 @@
+"""Moves existing chunks collections to another collection profile.
+
+    python -m jobs.migrate_collection --profile scalar --wait
+
+Qdrant re-indexes and re-quantizes the segments in the background; the collection
+stays searchable meanwhile. The asset_id index is re-created as a tenant index.
+Sparse vectors and the tenancy strategy cannot be changed on an existing
+collection, a collection created before hybrid search stays dense-only.
+"""
+import argparse
+import time
+from typing import Optional
+
+from qdrant_client.http import models
+
+from settings import settings
+from utils.collection_profiles import COLLECTION_PROFILES, get_collection_profile
+from utils.qdrant import get_qdrant_client
+from utils.tenancy import TenancyRouter
+
+
+def migrate_collection(
+    profile_name: str, collection_name: Optional[str] = None, wait: bool = False
+):
+    client = get_qdrant_client()
+    profile = get_collection_profile(profile_name)
+    tenancy = TenancyRouter()
+    collection_names = (
+        [collection_name] if collection_name else tenancy.get_collection_names()
+    )
+    for name in collection_names:
+        if not client.collection_exists(name):
+            continue
+        client.update_collection(collection_name=name, **profile.get_update_kwargs())
+        client.create_payload_index(
+            collection_name=name,
+            field_name="asset_id",
+            field_schema=tenancy.get_asset_id_index_schema(),
+        )
+        print(f"Collection {name} updated to profile {profile_name}")
+
+        while wait:
+            info = client.get_collection(name)
+            if info.status == models.CollectionStatus.GREEN:
+                break
+            print(f"Waiting for optimization of {name}, status {info.status}")
+            time.sleep(5)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Apply a collection profile to existing collections"
+    )
+    parser.add_argument(
+        "--profile",
+        default=settings.VECTOR_DB_COLLECTION_PROFILE,
+        choices=sorted(COLLECTION_PROFILES),
+    )
+    parser.add_argument(
+        "--collection", default=None, help="Defaults to all chunks collections"
+    )
+    parser.add_argument(
+        "--wait", action="store_true", help="Wait until the collection is optimized"
+    )
+
+    args = parser.parse_args()
+    migrate_collection(args.profile, args.collection, args.wait)
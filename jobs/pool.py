@@ -0,0 +1,160 @@
+import math
+from typing import Any, Dict, List, Optional
+
+import ray
+
+from settings import settings
+from utils.runtime_env import get_detached_actor
+
+ACTOR_POOL_SUPERVISOR_NAME = "ingestion-actor-pools"
+
+
+def _get_actor_class(stage: str):
+    # Imported lazily, the job module imports this one
+    from jobs.ingestion.job import Chunker, Embedder
+
+    stages = {"chunker": Chunker, "embedder": Embedder}
+    if stage not in stages:
+        raise ValueError(f"Unknown actor pool: {stage}")
+    return stages[stage]
+
+
+@ray.remote(num_cpus=0)
+class ActorPoolSupervisor:
+    """Owns named, detached Chunker/Embedder pools shared by all ingestion jobs.
+
+    Actors are created once and kept warm between jobs, so the embedding model is
+    loaded once per actor instead of once per job. Each job leases up to
+    INGESTION_WORKERS_PER_JOB actors per stage; leases are not exclusive, so
+    concurrent jobs share the least-loaded actors. Pool sizes follow the total queue
+    depth reported by running jobs, between INGESTION_POOL_MIN_SIZE and
+    MAX_INGESTION_JOB_WORKERS, and a job with a larger backlog than its lease covers
+    is also given a fair share of the actors nobody else has leased. Pools from an
+    older runtime package are killed along with their supervisor, which is then
+    created again with the current one.
+    """
+
+    def __init__(self, package_version: Optional[str] = None):
+        self.package_version = package_version
+        self.pools: Dict[str, List[Any]] = {}
+        self.leases: Dict[str, Dict[str, List[int]]] = {}
+        self.queue_depths: Dict[str, Dict[str, int]] = {}
+        self._next_index: Dict[str, int] = {}
+
+    def _ensure_stage(self, stage: str):
+        if stage not in self.pools:
+            self.pools[stage] = []
+            self.leases[stage] = {}
+            self.queue_depths[stage] = {}
+            self._next_index[stage] = 0
+
+    def _desired_size(self, stage: str) -> int:
+        depth = sum(self.queue_depths[stage].values())
+        desired = math.ceil(depth / settings.INGESTION_POOL_TARGET_QUEUE_PER_ACTOR)
+        if self.leases[stage]:
+            desired = max(desired, settings.INGESTION_WORKERS_PER_JOB)
+        return min(
+            max(desired, settings.INGESTION_POOL_MIN_SIZE),
+            settings.MAX_INGESTION_JOB_WORKERS,
+        )
+
+    def _lease_counts(self, stage: str) -> List[int]:
+        counts = [0] * len(self.pools[stage])
+        for leased in self.leases[stage].values():
+            for i in leased:
+                counts[i] += 1
+        return counts
+
+    def _scale(self, stage: str):
+        desired = self._desired_size(stage)
+        actor_cls = _get_actor_class(stage)
+        while len(self.pools[stage]) < desired:
+            name = f"ingestion-{stage}-{self._next_index[stage]}"
+            self._next_index[stage] += 1
+            # Handles outlive any one job, so an actor that dies (e.g. OOM) is
+            # restarted behind them rather than failing every later job
+            self.pools[stage].append(
+                actor_cls.options(
+                    name=name,
+                    namespace=settings.RAY_NAMESPACE,
+                    lifetime="detached",
+                    get_if_exists=True,
+                    max_restarts=-1,
+                ).remote()
+            )
+        # Only actors that no job holds a lease on can be removed
+        counts = self._lease_counts(stage)
+        while len(self.pools[stage]) > desired and counts[-1] == 0:
+            ray.kill(self.pools[stage].pop())
+            counts.pop()
+
+    def _wanted(self, stage: str, job_id: str) -> int:
+        # Actors a job's reported backlog calls for beyond its current lease
+        depth = self.queue_depths[stage].get(job_id, 0)
+        needed = math.ceil(depth / settings.INGESTION_POOL_TARGET_QUEUE_PER_ACTOR)
+        return needed - len(self.leases[stage].get(job_id, []))
+
+    def _lease(self, stage: str, job_id: str) -> List[Any]:
+        leased = self.leases[stage].setdefault(job_id, [])
+        counts = self._lease_counts(stage)
+        free = sorted(
+            (i for i in range(len(self.pools[stage])) if i not in leased),
+            key=lambda i: counts[i],
+        )
+        share = settings.INGESTION_WORKERS_PER_JOB - len(leased)
+        leased.extend(free[: max(share, 0)])
+
+        # A job whose backlog outgrows its share also takes actors no other job
+        # holds, split evenly between the jobs that want more
+        wanted = self._wanted(stage, job_id)
+        if wanted > 0:
+            counts = self._lease_counts(stage)
+            unleased = [i for i, count in enumerate(counts) if count == 0]
+            hungry = sum(
+                1 for other in self.leases[stage] if self._wanted(stage, other) > 0
+            )
+            fair_share = math.ceil(len(unleased) / max(hungry, 1))
+            leased.extend(unleased[: min(wanted, fair_share)])
+        return [self.pools[stage][i] for i in leased]
+
+    def acquire(self, stage: str, job_id: str) -> List[Any]:
+        self._ensure_stage(stage)
+        self.leases[stage].setdefault(job_id, [])
+        self._scale(stage)
+        return self._lease(stage, job_id)
+
+    def report_queue_depth(self, stage: str, job_id: str, depth: int) -> List[Any]:
+        """Records a job's backlog and returns its (possibly grown) lease."""
+        self._ensure_stage(stage)
+        self.queue_depths[stage][job_id] = depth
+        self._scale(stage)
+        return self._lease(stage, job_id)
+
+    def release(self, stage: str, job_id: str):
+        self._ensure_stage(stage)
+        self.leases[stage].pop(job_id, None)
+        self.queue_depths[stage].pop(job_id, None)
+        self._scale(stage)
+
+    def get_package_version(self) -> Optional[str]:
+        return self.package_version
+
+    def shutdown(self):
+        # Pooled actors are detached and named, they would outlive the supervisor
+        for actors in self.pools.values():
+            for actor in actors:
+                ray.kill(actor)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            stage: {
+                "size": len(actors),
+                "jobs": len(self.leases[stage]),
+                "queue_depth": sum(self.queue_depths[stage].values()),
+            }
+            for stage, actors in self.pools.items()
+        }
+
+
+def get_actor_pools():
+    return get_detached_actor(ActorPoolSupervisor, ACTOR_POOL_SUPERVISOR_NAME)
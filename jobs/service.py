@@ -0,0 +1,375 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, List, Optional, Union
+
+import ray
+from ray.exceptions import TaskCancelledError
+
+from constants import INGESTION_QUEUE
+from schema.base import (
+    GithubIngestionPayload,
+    IngestionJob,
+    IngestionStats,
+    S3IngestionPayload,
+)
+from settings import settings
+from utils.asset_versions import get_asset_versions
+from utils.logger import logger
+from utils.runtime_env import get_detached_actor, get_runtime_env
+
+IngestionPayloadType = Union[GithubIngestionPayload, S3IngestionPayload]
+
+
+def _parse_payload(payload_json: str) -> IngestionPayloadType:
+    payload = json.loads(payload_json)
+    if payload.get("asset_type") == "github":
+        return GithubIngestionPayload.model_validate(payload)
+    return S3IngestionPayload.model_validate(payload)
+
+
+# Pinned to the head node, so a restarted service always finds its database
+@ray.remote(
+    num_cpus=0,
+    max_restarts=-1,
+    max_concurrency=8,
+    resources={"node:__internal_head__": 0.001},
+)
+class IngestionService:
+    """Long-lived ingestion queue that runs at most PARALLEL_INGESTION_JOBS jobs.
+
+    Jobs are kept in SQLite on the head node, so a restarted service picks up where
+    it left off and re-runs the jobs that were interrupted (ingestion is
+    idempotent). The queue survives the loss of the head node only if
+    INGESTION_QUEUE_PATH is on a volume mounted into the head. A submission for an
+    asset that already has a queued job is merged into it and the job takes the
+    latest submitter as its owner. When a slot frees up, the next job is the oldest
+    one of the owner with the fewest running jobs, and an asset never has two jobs
+    running at once. A service from an older runtime package is replaced by
+    get_ingestion_service; the jobs it was running are queued again by the new one.
+    """
+
+    def __init__(
+        self,
+        path: str = settings.INGESTION_QUEUE_PATH,
+        max_running: int = settings.PARALLEL_INGESTION_JOBS,
+        package_version: Optional[str] = None,
+    ):
+        self.max_running = max(1, max_running)
+        self.package_version = package_version
+        self._stopped = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # job id -> ref of its ingest_asset task
+        self._running: Dict[str, ray.ObjectRef] = {}
+        # Assets being deleted, none of their jobs starts meanwhile
+        self._deleting = set()
+        self._waits = deque(maxlen=settings.INGESTION_QUEUE_WAIT_WINDOW)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                asset_id TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                payload TEXT,
+                status TEXT NOT NULL,
+                submitted_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                coalesced INTEGER NOT NULL DEFAULT 0,
+                stats TEXT,
+                error TEXT
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, submitted_at)"
+        )
+        # Jobs cut short by a restart of the service run again
+        self._conn.execute(
+            "UPDATE jobs SET status = 'queued', started_at = NULL "
+            "WHERE status = 'running'"
+        )
+        self._conn.execute(
+            "DELETE FROM jobs WHERE finished_at < ?",
+            (time.time() - settings.INGESTION_QUEUE_RETENTION_S,),
+        )
+        self._conn.commit()
+
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> IngestionJob:
+        return IngestionJob(
+            job_id=row["job_id"],
+            asset_id=row["asset_id"],
+            owner=row["owner"],
+            status=row["status"],
+            submitted_at=row["submitted_at"],
+            started_at=row["started_at"],
+            finished_at=row["finished_at"],
+            coalesced=row["coalesced"],
+            stats=(
+                IngestionStats.model_validate_json(row["stats"])
+                if row["stats"]
+                else None
+            ),
+            error=row["error"],
+        )
+
+    def submit(self, payload: IngestionPayloadType) -> Dict[str, Any]:
+        with self._lock:
+            queued = self._conn.execute(
+                "SELECT job_id, payload FROM jobs "
+                "WHERE asset_id = ? AND status = 'queued'",
+                (payload.asset_id,),
+            ).fetchone()
+            if queued is not None:
+                # The queued job keeps its place and runs with the latest payload
+                # (and owner), as a full re-ingestion if any submission asked so
+                previous = _parse_payload(queued["payload"])
+                incremental = previous.incremental and payload.incremental
+                merged = payload.model_copy(update={"incremental": incremental})
+                self._conn.execute(
+                    "UPDATE jobs SET payload = ?, owner = ?, "
+                    "coalesced = coalesced + 1 WHERE job_id = ?",
+                    (merged.model_dump_json(), payload.owner, queued["job_id"]),
+                )
+                self._conn.commit()
+                job_id, coalesced = queued["job_id"], True
+            else:
+                job_id, coalesced = uuid.uuid4().hex, False
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, asset_id, owner, payload, status, "
+                    "submitted_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (
+                        job_id,
+                        payload.asset_id,
+                        payload.owner,
+                        payload.model_dump_json(),
+                        time.time(),
+                    ),
+                )
+                self._conn.commit()
+        self._wakeup.set()
+        return {"job_id": job_id, "coalesced": coalesced}
+
+    def _next_job(self) -> Optional[sqlite3.Row]:
+        running = self._conn.execute(
+            "SELECT asset_id, owner FROM jobs WHERE status = 'running'"
+        ).fetchall()
+        running_assets = {row["asset_id"] for row in running}
+        running_per_owner: Dict[str, int] = {}
+        for row in running:
+            owner = row["owner"]
+            running_per_owner[owner] = running_per_owner.get(owner, 0) + 1
+        candidates = [
+            row
+            for row in self._conn.execute(
+                "SELECT job_id, asset_id, owner, payload, submitted_at FROM jobs "
+                "WHERE status = 'queued' ORDER BY submitted_at"
+            )
+            if row["asset_id"] not in running_assets
+            and row["asset_id"] not in self._deleting
+        ]
+        if not candidates:
+            return None
+        # Candidates are in submission order, min keeps the oldest on ties
+        return min(candidates, key=lambda row: running_per_owner.get(row["owner"], 0))
+
+    def _start_jobs(self):
+        # Imported lazily, the API imports this module only to reach the service
+        from jobs.ingestion.job import ingest_asset
+
+        with self._lock:
+            while not self._stopped and len(self._running) < self.max_running:
+                row = self._next_job()
+                if row is None:
+                    return
+                started_at = time.time()
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ? "
+                    "WHERE job_id = ?",
+                    (started_at, row["job_id"]),
+                )
+                self._conn.commit()
+                self._waits.append(started_at - row["submitted_at"])
+                self._running[row["job_id"]] = ingest_asset.remote(
+                    _parse_payload(row["payload"])
+                )
+
+    def _finish(self, job_id: str, ref: ray.ObjectRef):
+        stats, error = None, None
+        try:
+            stats = ray.get(ref).model_dump_json()
+            status = "succeeded"
+        except TaskCancelledError:
+            status = "cancelled"
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            status, error = "failed", str(e)
+        with self._lock:
+            self._running.pop(job_id, None)
+            # Payloads hold source credentials, they are not kept past the run
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, stats = ?, error = ?, "
+                "payload = NULL WHERE job_id = ?",
+                (status, time.time(), stats, error, job_id),
+            )
+            self._conn.commit()
+
+    def _run(self):
+        while True:
+            try:
+                self._start_jobs()
+                with self._lock:
+                    running = dict(self._running)
+                if not running:
+                    self._wakeup.wait(settings.INGESTION_QUEUE_POLL_S)
+                    self._wakeup.clear()
+                    continue
+                refs = {ref: job_id for job_id, ref in running.items()}
+                ready, _ = ray.wait(
+                    list(refs), num_returns=1, timeout=settings.INGESTION_QUEUE_POLL_S
+                )
+                for ref in ready:
+                    self._finish(refs[ref], ref)
+            except Exception as e:
+                logger.error(f"Ingestion service loop failed: {e}")
+                time.sleep(settings.INGESTION_QUEUE_POLL_S)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock:
+            ref = self._running.get(job_id)
+            if ref is None:
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ?, "
+                    "payload = NULL WHERE job_id = ? AND status = 'queued'",
+                    (time.time(), job_id),
+                )
+                self._conn.commit()
+                return cursor.rowcount > 0
+        # The task's cleanup releases its actors, _run records the cancellation
+        ray.cancel(ref)
+        return True
+
+    def delete_asset(self, asset_id: str):
+        """Deletes an asset's chunks and manifest once none of its jobs can write.
+
+        Queued jobs of the asset are cancelled, a running one is cancelled and
+        waited for, and no job of the asset starts until the deletion is done.
+        """
+        # Imported lazily, like ingest_asset
+        from jobs.ingestion.vectorstore import VectorStoreClient
+
+        with self._lock:
+            self._deleting.add(asset_id)
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?, "
+                "payload = NULL WHERE asset_id = ? AND status = 'queued'",
+                (time.time(), asset_id),
+            )
+            self._conn.commit()
+            running = [
+                self._running[row["job_id"]]
+                for row in self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE asset_id = ? AND status = 'running'",
+                    (asset_id,),
+                )
+                if row["job_id"] in self._running
+            ]
+        try:
+            # The task's cleanup releases its actors, _run records the cancellation
+            for ref in running:
+                ray.cancel(ref)
+            if running:
+                ray.wait(running, num_returns=len(running))
+            vectorstore = VectorStoreClient.remote()
+            try:
+                ray.get(vectorstore.delete_asset.remote(asset_id))
+            finally:
+                ray.kill(vectorstore)
+            get_asset_versions().bump.remote(asset_id)
+        finally:
+            with self._lock:
+                self._deleting.discard(asset_id)
+            self._wakeup.set()
+
+    def get_package_version(self) -> Optional[str]:
+        return self.package_version
+
+    def shutdown(self):
+        # Called before the service is replaced, so no job starts in between
+        with self._lock:
+            self._stopped = True
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return self._to_job(row).model_dump() if row is not None else None
+
+    def list_jobs(
+        self,
+        owner: Optional[str] = None,
+        status: Optional[str] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        query, params = "SELECT * FROM jobs WHERE 1 = 1", []
+        if owner is not None:
+            query += " AND owner = ?"
+            params.append(owner)
+        if status is not None:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY submitted_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_job(row).model_dump() for row in rows]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT owner, status, COUNT(*) AS count, MIN(submitted_at) AS oldest "
+                "FROM jobs WHERE status IN ('queued', 'running') "
+                "GROUP BY owner, status"
+            ).fetchall()
+            waits = list(self._waits)
+        queued_per_owner = {
+            row["owner"]: row["count"] for row in rows if row["status"] == "queued"
+        }
+        running_per_owner = {
+            row["owner"]: row["count"] for row in rows if row["status"] == "running"
+        }
+        oldest = [row["oldest"] for row in rows if row["status"] == "queued"]
+        return {
+            "max_running": self.max_running,
+            "queued": sum(queued_per_owner.values()),
+            "running": sum(running_per_owner.values()),
+            "queued_per_owner": queued_per_owner,
+            "running_per_owner": running_per_owner,
+            # How long the job at the head of the queue has been waiting
+            "oldest_wait_s": time.time() - min(oldest) if oldest else 0,
+            # Over the last INGESTION_QUEUE_WAIT_WINDOW started jobs
+            "mean_wait_s": sum(waits) / len(waits) if waits else 0,
+            "max_wait_s": max(waits) if waits else 0,
+        }
+
+
+def get_ingestion_service():
+    # The runtime env only applies when the service is created; jobs then start in
+    # the service's already set up workers instead of preparing one each
+    return get_detached_actor(
+        IngestionService, INGESTION_QUEUE, runtime_env=get_runtime_env()
+    )
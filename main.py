@@ -3,6 +3,9 @@ import os
 import ray
 
 from api.serve.base import ServeDeployment
+from api.serve.embedder import QueryEmbedder
+from api.serve.reranker import Reranker
+from api.serve.searcher import VectorSearcher
 from settings import settings
 from utils.logger import logger
 
@@ -19,4 +22,4 @@ if not ray.is_initialized():
     logger.info("Ray initialized")
     ray.init(address=settings.RAY_ADDRESS, ignore_reinit_error=True, _temp_dir=temp_dir)
 
-app = ServeDeployment.bind()
+app = ServeDeployment.bind(QueryEmbedder.bind(), VectorSearcher.bind(), Reranker.bind())
@@ -1,6 +1,9 @@
-from typing import Any, Dict, List, Literal, Optional, Union
+import itertools
+import time
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 
-from pydantic import BaseModel, validator
+import numpy as np
+from pydantic import BaseModel, ConfigDict, computed_field, validator
 
 
 class Document(BaseModel):
@@ -8,6 +11,7 @@ class Document(BaseModel):
     doc_id: str
     filename: Optional[str] = ""
     filepath: Optional[str] = ""
+    content_hash: Optional[str] = ""
     text: str
     metadata: Dict[str, Any]
     uploaded_by: str
@@ -16,13 +20,124 @@ class Document(BaseModel):
     error: bool = False
 
 
-class Chunk(BaseModel):
+class ChunkBatch(BaseModel):
+    """Chunks of several documents of one asset, stored column-wise.
+
+    Metadata is kept once per document and shared by all of its chunks. Vectors
+    are numpy arrays rather than lists of Python floats, so Ray hands them between
+    the actors as a few zero-copy buffers; they only become lists when the points
+    are sent to Qdrant.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     asset_id: str
-    chunk_id: str
-    doc_id: str
-    text: str
-    metadata: Dict[str, Any]
-    embeddings: Optional[List[float]] = []
+    chunk_ids: List[str] = []
+    doc_ids: List[str] = []
+    texts: List[str] = []
+    metadata: Dict[str, Dict[str, Any]] = {}
+    filepaths: Dict[str, str] = {}
+    content_hashes: Dict[str, str] = {}
+    # float32, one row per chunk
+    embeddings: Optional[np.ndarray] = None
+    # Lexical vectors (see utils.sparse) in CSR layout: the indices and values of
+    # chunk i are at sparse_offsets[i]:sparse_offsets[i + 1]
+    sparse_indices: Optional[np.ndarray] = None
+    sparse_values: Optional[np.ndarray] = None
+    sparse_offsets: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def set_sparse_vectors(self, vectors: List[Tuple[List[int], List[float]]]):
+        lengths = [len(indices) for indices, _ in vectors]
+        self.sparse_offsets = np.zeros(len(vectors) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.sparse_offsets[1:])
+        total = int(self.sparse_offsets[-1])
+        self.sparse_indices = np.fromiter(
+            itertools.chain.from_iterable(indices for indices, _ in vectors),
+            dtype=np.uint32,
+            count=total,
+        )
+        self.sparse_values = np.fromiter(
+            itertools.chain.from_iterable(values for _, values in vectors),
+            dtype=np.float32,
+            count=total,
+        )
+
+    def get_sparse_vectors(
+        self, start: int = 0, end: Optional[int] = None
+    ) -> List[Tuple[List[int], List[float]]]:
+        if self.sparse_offsets is None:
+            return []
+        end = len(self) if end is None else min(end, len(self))
+        bounds = self.sparse_offsets[start : end + 1].tolist()
+        return [
+            (
+                self.sparse_indices[lo:hi].tolist(),
+                self.sparse_values[lo:hi].tolist(),
+            )
+            for lo, hi in zip(bounds, bounds[1:])
+        ]
+
+
+class IngestionStats(BaseModel):
+    asset_id: str
+    docs_read: int = 0
+    files_total: int = 0
+    files_changed: int = 0
+    files_removed: int = 0
+    chunks_stored: int = 0
+    elapsed_s: float = 0
+    embed_elapsed_s: float = 0
+    store_elapsed_s: float = 0
+    # Seconds from the start of the job until the pipeline started (actors leased
+    # or requested), and until its first chunks were upserted
+    startup_s: float = 0
+    first_chunk_s: float = 0
+    # Changed files that passed or failed the reader's FileFilter
+    files_kept: int = 0
+    bytes_kept: int = 0
+    files_skipped: int = 0
+    bytes_skipped: int = 0
+    files_skipped_by_reason: Dict[str, int] = {}
+    # Chunks whose embedding was found in the shared embedding cache, or not
+    embedding_cache_hits: int = 0
+    embedding_cache_misses: int = 0
+    actor_utilisation: Dict[str, List[float]] = {}
+
+    @computed_field
+    @property
+    def embed_chunks_per_s(self) -> float:
+        return self.chunks_stored / self.embed_elapsed_s if self.embed_elapsed_s else 0
+
+    @computed_field
+    @property
+    def upsert_points_per_s(self) -> float:
+        return self.chunks_stored / self.store_elapsed_s if self.store_elapsed_s else 0
+
+
+IngestionJobStatus = Literal["queued", "running", "succeeded", "failed", "cancelled"]
+
+
+class IngestionJob(BaseModel):
+    job_id: str
+    asset_id: str
+    owner: str
+    status: IngestionJobStatus
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # Later submissions for the same asset merged into this job while it was queued
+    coalesced: int = 0
+    stats: Optional[IngestionStats] = None
+    error: Optional[str] = None
+
+    @computed_field
+    @property
+    def wait_s(self) -> float:
+        end = self.started_at or self.finished_at or time.time()
+        return end - self.submitted_at
 
 
 class Context(BaseModel):
@@ -31,11 +146,40 @@ class Context(BaseModel):
     score: float = 0
 
 
+class ExtensionPolicy(BaseModel):
+    skip: bool = False
+    # Overrides FileFilter.max_file_bytes for this extension
+    max_file_bytes: Optional[int] = None
+    # Binary/minified/generated detection, e.g. off for wanted one-line JSON data
+    check_content: bool = True
+
+
+class FileFilter(BaseModel):
+    """Which files of an asset are chunked and embedded.
+
+    Globs are matched case-insensitively against the file path and any of its
+    trailing segments, so `node_modules/*` also excludes `web/node_modules/x.js`.
+    Extension policies are keyed by extension without the dot (e.g. "json").
+    """
+
+    include: List[str] = []
+    exclude: List[str] = []
+    # Lockfiles, vendored/built output, media, archives and compiled files
+    default_excludes: bool = True
+    # Defaults to READER_MAX_FILE_BYTES, documents (PDF, Office) are exempt
+    max_file_bytes: Optional[int] = None
+    skip_binary: bool = True
+    skip_minified: bool = True
+    skip_generated: bool = True
+    extensions: Dict[str, ExtensionPolicy] = {}
+
+
 class GithubReader(BaseModel):
     owner: str
     repo: str
     branch: str = "main"
     github_token: str
+    filters: FileFilter = FileFilter()
 
 
 class S3Reader(BaseModel):
@@ -43,9 +187,11 @@ class S3Reader(BaseModel):
     access_key: str
     secret_key: str
     endpoint: str = None
+    filters: FileFilter = FileFilter()
 
 
 AllowedAssetTypes = Literal["github", "s3"]
+RerankMode = Literal["off", "fast", "full"]
 AllowedReaderKwargs = Union[S3Reader, GithubReader]
 
 
@@ -55,6 +201,7 @@ class IngestionPayload(BaseModel):
     owner: str
     reader_kwargs: AllowedReaderKwargs
     extra_metadata: Dict[str, Any] = {}
+    incremental: bool = True
 
     @validator("reader_kwargs", pre=True, always=True)
     def validate_reader_kwargs(cls, value, values):
@@ -72,6 +219,7 @@ class GithubIngestionPayload(BaseModel):
     owner: str
     reader_kwargs: GithubReader
     extra_metadata: Dict[str, Any] = {}
+    incremental: bool = True
 
 
 class S3IngestionPayload(BaseModel):
@@ -80,10 +228,26 @@ class S3IngestionPayload(BaseModel):
     owner: str
     reader_kwargs: S3Reader
     extra_metadata: Dict[str, Any] = {}
+    incremental: bool = True
 
 
 class RetrievalPayload(BaseModel):
     query: str
     asset_ids: List[str]
+    # Reranked requests return at most RERANK_BUDGET (RERANK_FAST_BUDGET) contexts
     num_contexts: int = 10
     score_threshold: float = 1
+    # off: vector search order and scores, score_threshold is not applied
+    # fast: a smaller budget of shorter (query, context) pairs is reranked
+    rerank_mode: RerankMode = "full"
+
+
+class BatchRetrievalPayload(BaseModel):
+    queries: List[RetrievalPayload]
+    # Stream one NDJSON line per query as soon as it completes
+    stream: bool = False
+
+
+class BatchRetrievalResult(BaseModel):
+    index: int
+    contexts: List[Context]
@@ -15,10 +15,12 @@ class Settings(BaseSettings):
 
     # Ray config
     RAY_ADDRESS: str = "auto"
+    RAY_NAMESPACE: str = "ragswift"
     RAY_DASHBOARD_ADDRESS: str = (
         "http://172.17.0.1:8265" if ENV == "docker" else "http://127.0.0.1:8265"
     )
     MAX_INGESTION_JOB_WORKERS: int = 2
+    # Ingestion jobs the ingestion service runs at once
     PARALLEL_INGESTION_JOBS: int = 1
 
     @computed_field
@@ -26,6 +28,35 @@ class Settings(BaseSettings):
     def INGESTION_WORKERS_PER_JOB(self) -> int:
         return self.MAX_INGESTION_JOB_WORKERS // self.PARALLEL_INGESTION_JOBS
 
+    # Ingestion pipeline config
+    INGESTION_READ_BATCH_SIZE: int = 32
+    INGESTION_READER_SHARDS: int = 1
+    READER_CONCURRENCY: int = 16
+    READER_MAX_FILE_BYTES: int = 1_000_000
+    READER_MINIFIED_LINE_LENGTH: int = 300
+    INGESTION_CHUNK_BATCH_BYTES: int = 262144
+    INGESTION_CHUNK_BATCH_MIN_BYTES: int = 16384
+    INGESTION_CHUNK_BATCH_MAX_BYTES: int = 4194304
+    INGESTION_CHUNK_BATCH_TARGET_S: float = 1
+    INGESTION_MAX_IN_FLIGHT: int = 4
+    INGESTION_MAX_OUTSTANDING_PER_ACTOR: int = 2
+    INGESTION_LARGEST_FIRST: bool = True
+    INGESTION_POOL_MIN_SIZE: int = 1
+    INGESTION_POOL_TARGET_QUEUE_PER_ACTOR: int = 2
+    INGESTION_POOL_REPORT_INTERVAL_S: float = 2
+    # On the head node, mount a volume here for the queue to outlive the head pod
+    INGESTION_QUEUE_PATH: str = "/tmp/ragswift/ingestion_queue.sqlite3"
+    INGESTION_QUEUE_POLL_S: float = 1
+    INGESTION_QUEUE_RETENTION_S: float = 604800
+    INGESTION_QUEUE_WAIT_WINDOW: int = 100
+    # Ship the ingestion code to the service as a content-addressed package,
+    # otherwise it inherits the runtime env of the process that creates it
+    RUNTIME_PACKAGE_ENABLED: bool = True
+    RUNTIME_PACKAGE_DIR: str = "/tmp/ragswift/runtime"
+    # Detached actors from an older package are replaced, waiting this long for each
+    RUNTIME_PACKAGE_REPLACE_ATTEMPTS: int = 50
+    RUNTIME_PACKAGE_REPLACE_INTERVAL_S: float = 0.2
+
     # Model configs
     EMBEDDING_MODEL: str = "BAAI/bge-base-en-v1.5"
     USE_SENTENCE_TRANSFORMERS: bool = True
@@ -33,15 +64,63 @@ class Settings(BaseSettings):
     CHUNK_SIZE: int = 300
     CHUNK_OVERLAP: int = 100
     RERANKER_MODEL: str = "BAAI/bge-reranker-base"
+    # torch, torch-int8 (dynamic quantization) or onnx (ONNX Runtime)
+    EMBEDDING_BACKEND: str = "torch"
+    RERANKER_BACKEND: str = "torch"
+    ONNX_MODEL_DIR: str = "/tmp/ragswift/onnx"
+    # Used by the onnx backend, which does not read the SentenceTransformer config
+    EMBEDDING_POOLING: str = "cls"
+    EMBEDDING_NORMALIZE: bool = True
+    EMBEDDING_MAX_BATCH_SIZE: int = 64
+    EMBEDDING_BATCH_CHAR_BUDGET: int = 32768
+    EMBEDDING_BATCH_WAIT_TIMEOUT_S: float = 0.05
+    TEXT_REMOVE_STOPWORDS: bool = True
+    TEXT_STOPWORDS_LANGUAGE: str = "en"
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "/tmp/ragswift/embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 1000000
+    # Hits refresh an entry's last access at most this often, written in batches
+    EMBEDDING_CACHE_TOUCH_INTERVAL_S: float = 60
+    SERVE_EMBED_MAX_BATCH_SIZE: int = 32
+    SERVE_EMBED_BATCH_WAIT_TIMEOUT_S: float = 0.005
+    SERVE_RERANK_MAX_BATCH_SIZE: int = 8
+    SERVE_RERANK_BATCH_WAIT_TIMEOUT_S: float = 0.005
+    SEARCH_OVERFETCH_FACTOR: int = 2
+    HYBRID_SEARCH_ENABLED: bool = True
+    # How long the searcher trusts its list of existing shard keys
+    SEARCH_SHARD_KEYS_TTL_S: float = 5
+    SPARSE_BM25_K1: float = 1.2
+    SPARSE_BM25_B: float = 0.75
+    SPARSE_BM25_AVG_DOC_LENGTH: float = 256
+    QUERY_CACHE_ENABLED: bool = True
+    QUERY_CACHE_MAX_ENTRIES: int = 10000
+    QUERY_CACHE_TTL_S: float = 300
+    QUERY_CACHE_VERSION_REFRESH_S: float = 1
+    RERANK_BUDGET: int = 20
+    RERANK_MAX_LENGTH: int = 512
+    RERANK_FAST_BUDGET: int = 8
+    RERANK_FAST_MAX_LENGTH: int = 128
+    RERANK_SUB_BATCH_SIZE: int = 16
 
     # Vector db config
     VECTOR_DB_COLLECTION_NAME: str = "default"
+    # filtered-on-disk, latency, memory, scalar or product, see
+    # utils/collection_profiles.py
+    VECTOR_DB_COLLECTION_PROFILE: str = "scalar"
+    # payload, shard_key or groups, see utils/tenancy.py
+    VECTOR_DB_TENANCY: str = "payload"
+    VECTOR_DB_TENANCY_GROUPS: int = 16
     QDRANT_BASE_URI: str = "172.17.0.1" if ENV == "docker" else "127.0.0.1"
     QDRANT_USE_HTTPS: bool = False
     QDRANT_API_KEY: str
     QDRANT_PORT: str = "6333"
     QDRANT_GRPC_PORT: str = "6334"
-    QDRANT_PREFER_GRPC: str = "0"
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_UPSERT_BATCH_SIZE: int = 256
+    QDRANT_UPSERT_CONCURRENCY: int = 4
+
+    # GitHub config
+    GITHUB_API_URL: str = "https://api.github.com"
 
     # S3 config
     S3_ENDPOINT: str = "172.17.0.1:9000" if ENV == "docker" else "127.0.0.1:9000"
@@ -0,0 +1,36 @@
+import uuid
+from typing import Dict
+
+import ray
+
+from settings import settings
+
+ASSET_VERSION_REGISTRY_NAME = "asset-version-registry"
+
+
+@ray.remote(num_cpus=0)
+class AssetVersionRegistry:
+    """Current version of every asset, changed whenever an ingestion job for it ends.
+
+    Versions are random tokens rather than counters, so a restarted registry never
+    hands out a version that a cache entry was already stamped with.
+    """
+
+    def __init__(self):
+        self.versions: Dict[str, str] = {}
+
+    def bump(self, asset_id: str) -> str:
+        self.versions[asset_id] = uuid.uuid4().hex
+        return self.versions[asset_id]
+
+    def get_versions(self) -> Dict[str, str]:
+        return self.versions
+
+
+def get_asset_versions():
+    return AssetVersionRegistry.options(
+        name=ASSET_VERSION_REGISTRY_NAME,
+        namespace=settings.RAY_NAMESPACE,
+        lifetime="detached",
+        get_if_exists=True,
+    ).remote()
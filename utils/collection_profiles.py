@@ -0,0 +1,141 @@
+from typing import Any, Dict, Literal, Optional
+
+from pydantic import BaseModel
+from qdrant_client.http import models
+
+from settings import settings
+
+
+class CollectionProfile(BaseModel):
+    """Storage, index and search settings of the chunks collection."""
+
+    vectors_on_disk: bool
+    payload_on_disk: bool
+    # m=0 disables the global HNSW graph, only the per-asset (payload_m) graphs
+    # are built
+    hnsw_m: int
+    hnsw_payload_m: int = 16
+    hnsw_ef_construct: int = 100
+    hnsw_on_disk: bool = False
+    hnsw_ef: Optional[int] = None
+    quantization: Optional[Literal["scalar", "product"]] = None
+    quantization_always_ram: bool = True
+    # Re-score quantized candidates with the original vectors
+    rescore: bool = True
+    oversampling: Optional[float] = None
+
+    def get_vectors_config(self, size: int) -> models.VectorParams:
+        return models.VectorParams(
+            size=size, distance=models.Distance.COSINE, on_disk=self.vectors_on_disk
+        )
+
+    def get_hnsw_config(self) -> models.HnswConfigDiff:
+        return models.HnswConfigDiff(
+            m=self.hnsw_m,
+            payload_m=self.hnsw_payload_m,
+            ef_construct=self.hnsw_ef_construct,
+            on_disk=self.hnsw_on_disk,
+        )
+
+    def get_quantization_config(self) -> Optional[models.QuantizationConfig]:
+        if self.quantization == "scalar":
+            return models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(
+                    type=models.ScalarType.INT8,
+                    quantile=0.99,
+                    always_ram=self.quantization_always_ram,
+                )
+            )
+        if self.quantization == "product":
+            return models.ProductQuantization(
+                product=models.ProductQuantizationConfig(
+                    compression=models.CompressionRatio.X16,
+                    always_ram=self.quantization_always_ram,
+                )
+            )
+        return None
+
+    def get_create_kwargs(self, size: int) -> Dict[str, Any]:
+        return {
+            "vectors_config": self.get_vectors_config(size),
+            "on_disk_payload": self.payload_on_disk,
+            "hnsw_config": self.get_hnsw_config(),
+            "quantization_config": self.get_quantization_config(),
+        }
+
+    def get_update_kwargs(self) -> Dict[str, Any]:
+        """Arguments of update_collection that move an existing collection to this
+        profile; Qdrant rebuilds the affected segments in the background."""
+        return {
+            # The chunks collection's dense vector is the unnamed one
+            "vectors_config": {
+                "": models.VectorParamsDiff(on_disk=self.vectors_on_disk)
+            },
+            "hnsw_config": self.get_hnsw_config(),
+            "quantization_config": self.get_quantization_config()
+            or models.Disabled.DISABLED,
+            "collection_params": models.CollectionParamsDiff(
+                on_disk_payload=self.payload_on_disk
+            ),
+        }
+
+    def get_search_params(self) -> models.SearchParams:
+        quantization = None
+        if self.quantization is not None:
+            quantization = models.QuantizationSearchParams(
+                rescore=self.rescore, oversampling=self.oversampling
+            )
+        return models.SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+
+COLLECTION_PROFILES: Dict[str, CollectionProfile] = {
+    # What every collection used to be created with: no global graph, so searches
+    # across many assets or without a filter are a full scan
+    "filtered-on-disk": CollectionProfile(
+        vectors_on_disk=True,
+        payload_on_disk=True,
+        hnsw_m=0,
+        hnsw_on_disk=True,
+    ),
+    # Vectors and graph in RAM
+    "latency": CollectionProfile(
+        vectors_on_disk=False,
+        payload_on_disk=False,
+        hnsw_m=16,
+        hnsw_ef=128,
+    ),
+    # Vectors, graph and payload on disk, only the page cache is used
+    "memory": CollectionProfile(
+        vectors_on_disk=True,
+        payload_on_disk=True,
+        hnsw_m=16,
+        hnsw_on_disk=True,
+        hnsw_ef=64,
+    ),
+    # int8 vectors in RAM (4x smaller), originals on disk for rescoring
+    "scalar": CollectionProfile(
+        vectors_on_disk=True,
+        payload_on_disk=True,
+        hnsw_m=16,
+        hnsw_ef=128,
+        quantization="scalar",
+        oversampling=2,
+    ),
+    # Product-quantized vectors in RAM (16x smaller), originals on disk
+    "product": CollectionProfile(
+        vectors_on_disk=True,
+        payload_on_disk=True,
+        hnsw_m=16,
+        hnsw_ef=128,
+        quantization="product",
+        oversampling=4,
+    ),
+}
+
+
+def get_collection_profile(
+    name: str = settings.VECTOR_DB_COLLECTION_PROFILE,
+) -> CollectionProfile:
+    if name not in COLLECTION_PROFILES:
+        raise ValueError(f"Collection profile {name} is not supported")
+    return COLLECTION_PROFILES[name]
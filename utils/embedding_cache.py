@@ -0,0 +1,176 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from settings import settings
+
+
+class EmbeddingCache:
+    """On-disk embedding cache shared by the ingestion embedders and the serve replicas.
+
+    Entries are keyed by (model, sha256 of the preprocessed text) and stored as float32
+    blobs in SQLite, so every process on a node can share the same file. When the
+    cache grows past `max_entries` the least recently used entries are evicted.
+    Hits do not write: access times older than `touch_interval_s` are collected
+    and written with the next put or once per interval, so recency is approximate.
+    """
+
+    _EVICTION_CHECK_INTERVAL = 1000
+
+    def __init__(
+        self,
+        path: str,
+        model: str,
+        max_entries: int,
+        touch_interval_s: float = settings.EMBEDDING_CACHE_TOUCH_INTERVAL_S,
+    ):
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.touch_interval_s = touch_interval_s
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_check = 0
+        # text hash -> access time not yet written
+        self._touches: Dict[str, float] = {}
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access "
+            "ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Returns the cached embedding of each text, or None for a miss."""
+        hashes = [self._hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        now = time.time()
+        with self._lock:
+            unique = list(set(hashes))
+            # Stay below SQLite's bound parameter limit
+            for i in range(0, len(unique), 500):
+                part = unique[i : i + 500]
+                rows = self._conn.execute(
+                    "SELECT text_hash, vector, last_access FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                    [self.model, *part],
+                ).fetchall()
+                for text_hash, vector, last_access in rows:
+                    found[text_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+                    if now - last_access >= self.touch_interval_s:
+                        self._touches[text_hash] = now
+            if self._touches and now - self._last_flush >= self.touch_interval_s:
+                self._flush_touches()
+                self._conn.commit()
+        results = [found.get(text_hash) for text_hash in hashes]
+        hits = sum(1 for result in results if result is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        now = time.time()
+        rows = [
+            (
+                self.model,
+                self._hash(text),
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            # Pending touches ride along in the same transaction
+            self._flush_touches()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._puts_since_check += len(rows)
+            if self._puts_since_check >= self._EVICTION_CHECK_INTERVAL:
+                self._puts_since_check = 0
+                self._evict()
+
+    def _flush_touches(self):
+        # Left to the caller to commit
+        if self._touches:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? "
+                "WHERE model = ? AND text_hash = ?",
+                [
+                    (access, self.model, text_hash)
+                    for text_hash, access in self._touches.items()
+                ],
+            )
+            self._touches.clear()
+        self._last_flush = time.time()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+            (overflow,),
+        )
+        self._conn.commit()
+
+    def get_stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0,
+        }
+
+
+def get_cache_model_key() -> str:
+    # Backends drift slightly from each other, so the vectors of every backend
+    # (and pooling/normalization) are cached separately in the shared file
+    return ":".join(
+        [
+            settings.EMBEDDING_MODEL,
+            settings.EMBEDDING_BACKEND,
+            "st" if settings.USE_SENTENCE_TRANSFORMERS else "hf",
+            settings.EMBEDDING_POOLING,
+            "norm" if settings.EMBEDDING_NORMALIZE else "raw",
+        ]
+    )
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    return EmbeddingCache(
+        path=settings.EMBEDDING_CACHE_PATH,
+        model=get_cache_model_key(),
+        max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+    )
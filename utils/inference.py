@@ -0,0 +1,126 @@
+import os
+import shutil
+from typing import Any, List, Literal, Tuple
+
+import numpy as np
+
+from settings import settings
+
+InferenceBackend = Literal["torch", "torch-int8", "onnx"]
+
+
+def _quantize(model: Any) -> Any:
+    # Imported lazily, so stages that never load a model do not import torch
+    import torch
+
+    # Dynamic int8 quantization of the linear layers, activations stay fp32
+    return torch.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def _onnx_model_dir(model_name: str, task: str) -> str:
+    return os.path.join(settings.ONNX_MODEL_DIR, task, model_name.replace("/", "--"))
+
+
+def _load_onnx(model_cls: Any, model_name: str, task: str):
+    # Exporting takes a while, so the exported model is saved and reused
+    path = _onnx_model_dir(model_name, task)
+    if os.path.isdir(path):
+        return model_cls.from_pretrained(path)
+    model = model_cls.from_pretrained(model_name, export=True)
+    # Saved aside and renamed, so models starting together on a node never load a
+    # half-written directory
+    partial = f"{path}.{os.getpid()}.tmp"
+    model.save_pretrained(partial)
+    try:
+        os.replace(partial, path)
+    except OSError:
+        # Another process put its export in place first
+        shutil.rmtree(partial, ignore_errors=True)
+    return model
+
+
+class OnnxEmbeddingModel:
+    """Embedding model exported to ONNX Runtime, with the SentenceTransformer
+    `encode` interface."""
+
+    def __init__(self, model_name: str):
+        # Optional dependency, only needed for the onnx backend
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = _load_onnx(ORTModelForFeatureExtraction, model_name, "embedding")
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        if settings.EMBEDDING_POOLING == "cls":
+            return hidden[:, 0]
+        mask = attention_mask[..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences: List[str], batch_size: int = 32) -> np.ndarray:
+        embeddings = []
+        for i in range(0, len(sentences), batch_size):
+            inputs = self.tokenizer(
+                sentences[i : i + batch_size],
+                padding=True,
+                truncation=True,
+                return_tensors="np",
+            )
+            hidden = self.model(**inputs).last_hidden_state
+            embeddings.append(self._pool(hidden, inputs["attention_mask"]))
+        if not embeddings:
+            return np.zeros((0, settings.EMBEDDING_DIMENSION), dtype=np.float32)
+        embeddings = np.concatenate(embeddings)
+        if settings.EMBEDDING_NORMALIZE:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings = embeddings / np.clip(norms, 1e-12, None)
+        return embeddings
+
+
+def load_embedding_model(
+    model_name: str = settings.EMBEDDING_MODEL,
+    backend: InferenceBackend = settings.EMBEDDING_BACKEND,
+):
+    """Returns a model with a SentenceTransformer-like `encode`."""
+    if backend == "onnx":
+        return OnnxEmbeddingModel(model_name)
+    if settings.USE_SENTENCE_TRANSFORMERS:
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(model_name)
+    else:
+        from transformers import AutoModel
+
+        model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
+    if backend == "torch-int8":
+        model = _quantize(model)
+    elif backend != "torch":
+        raise ValueError(f"Inference backend {backend} is not supported")
+    model.eval()
+    return model
+
+
+def load_reranker_model(
+    model_name: str = settings.RERANKER_MODEL,
+    backend: InferenceBackend = settings.RERANKER_BACKEND,
+) -> Tuple[Any, Any]:
+    """Returns (tokenizer, model); the model takes the tokenizer's pt tensors and
+    returns an output with `logits`."""
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+
+        return tokenizer, _load_onnx(
+            ORTModelForSequenceClassification, model_name, "reranker"
+        )
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    if backend == "torch-int8":
+        model = _quantize(model)
+    elif backend != "torch":
+        raise ValueError(f"Inference backend {backend} is not supported")
+    model.eval()
+    return tokenizer, model
@@ -0,0 +1,25 @@
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from settings import settings
+
+
+def get_qdrant_client() -> QdrantClient:
+    return QdrantClient(
+        url=settings.QDRANT_BASE_URI,
+        port=int(settings.QDRANT_PORT),
+        grpc_port=int(settings.QDRANT_GRPC_PORT),
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        api_key=settings.QDRANT_API_KEY,
+        https=settings.QDRANT_USE_HTTPS,
+    )
+
+
+def get_async_qdrant_client() -> AsyncQdrantClient:
+    return AsyncQdrantClient(
+        url=settings.QDRANT_BASE_URI,
+        port=int(settings.QDRANT_PORT),
+        grpc_port=int(settings.QDRANT_GRPC_PORT),
+        prefer_grpc=settings.QDRANT_PREFER_GRPC,
+        api_key=settings.QDRANT_API_KEY,
+        https=settings.QDRANT_USE_HTTPS,
+    )
@@ -0,0 +1,80 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from schema.base import RetrievalPayload
+
+Key = Tuple[Any, ...]
+
+
+class QueryCache:
+    """In-replica LRU cache of retrieval results with a TTL.
+
+    Every entry is stamped with the versions of the assets it was computed from
+    (all assets for a query without asset_ids) and is a miss as soon as one of them
+    changed, i.e. once an ingestion job for one of those assets has finished.
+    """
+
+    def __init__(self, max_entries: int, ttl_s: float):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries: "OrderedDict[Key, Tuple[float, Dict[str, str], Any]]" = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def get_key(request: RetrievalPayload) -> Key:
+        return (
+            " ".join(request.query.lower().split()),
+            tuple(sorted(set(request.asset_ids))),
+            request.num_contexts,
+            request.score_threshold,
+            request.rerank_mode,
+        )
+
+    @staticmethod
+    def _snapshot(asset_ids: List[str], versions: Dict[str, str]) -> Dict[str, str]:
+        if not asset_ids:
+            return dict(versions)
+        return {asset_id: versions.get(asset_id, "") for asset_id in asset_ids}
+
+    def get(self, key: Key, versions: Dict[str, str]) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        created_at, snapshot, value = entry
+        if (
+            time.monotonic() - created_at > self.ttl_s
+            or self._snapshot(list(key[1]), versions) != snapshot
+        ):
+            del self._entries[key]
+            self.invalidations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Key, versions: Dict[str, str], value: Any):
+        self._entries[key] = (
+            time.monotonic(),
+            self._snapshot(list(key[1]), versions),
+            value,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / total if total else 0,
+        }
@@ -0,0 +1,134 @@
+import functools
+import hashlib
+import os
+import time
+import zipfile
+from typing import Any, Dict, List, Optional, Set
+
+import ray
+from ray.exceptions import RayActorError
+
+from settings import settings
+from utils.logger import logger
+
+# Everything the ingestion service and its stages import, relative to the root
+RUNTIME_PACKAGE_PATHS = [
+    "jobs",
+    "schema",
+    "utils",
+    "settings.py",
+    "constants.py",
+    ".env",
+]
+# Set in the runtime env, so packaged workers know which package they run
+RUNTIME_PACKAGE_ENV_VAR = "RAGSWIFT_RUNTIME_PACKAGE"
+
+# Names of the detached actors this process has already checked
+_checked_actors: Set[str] = set()
+
+
+def _list_files(root: str) -> List[str]:
+    files = []
+    for path in RUNTIME_PACKAGE_PATHS:
+        full_path = os.path.join(root, path)
+        if os.path.isfile(full_path):
+            files.append(path)
+            continue
+        for dir_path, dir_names, file_names in os.walk(full_path):
+            dir_names[:] = sorted(d for d in dir_names if d != "__pycache__")
+            for file_name in sorted(file_names):
+                if not file_name.endswith(".pyc"):
+                    rel_path = os.path.relpath(os.path.join(dir_path, file_name), root)
+                    files.append(rel_path)
+    return files
+
+
+def build_runtime_package(
+    root: str = ".", output_dir: str = settings.RUNTIME_PACKAGE_DIR
+) -> str:
+    """Zips the ingestion code into `output_dir` under a hash of its content.
+
+    An unchanged tree maps to the same file, which Ray has then already uploaded
+    to the cluster (packages are stored by content hash), while any change to the
+    code produces a new package.
+    """
+    files = _list_files(root)
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(path.encode("utf-8"))
+        with open(os.path.join(root, path), "rb") as f:
+            digest.update(f.read())
+    package = os.path.join(output_dir, f"ragswift-{digest.hexdigest()[:16]}.zip")
+    if not os.path.exists(package):
+        os.makedirs(output_dir, exist_ok=True)
+        # Written aside and renamed, concurrent builders never see a partial file
+        partial = f"{package}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(partial, "w", zipfile.ZIP_DEFLATED) as archive:
+            for path in files:
+                archive.write(os.path.join(root, path), path)
+        os.replace(partial, package)
+    return package
+
+
+@functools.lru_cache(maxsize=1)
+def get_runtime_env() -> Optional[Dict[str, Any]]:
+    """Runtime env of the ingestion service, built once per process.
+
+    Dependencies are installed in the image, so only the code is shipped.
+    """
+    if not settings.RUNTIME_PACKAGE_ENABLED:
+        return None
+    package = build_runtime_package()
+    version = os.path.splitext(os.path.basename(package))[0]
+    return {"working_dir": package, "env_vars": {RUNTIME_PACKAGE_ENV_VAR: version}}
+
+
+def get_runtime_package_version() -> Optional[str]:
+    """Name of the package the current process runs, None when not packaged."""
+    if RUNTIME_PACKAGE_ENV_VAR in os.environ:
+        return os.environ[RUNTIME_PACKAGE_ENV_VAR]
+    runtime_env = get_runtime_env()
+    if runtime_env is None:
+        return None
+    return runtime_env["env_vars"][RUNTIME_PACKAGE_ENV_VAR]
+
+
+def _get_actor_version(actor) -> Optional[str]:
+    try:
+        return ray.get(actor.get_package_version.remote())
+    except RayActorError:
+        return None
+
+
+def get_detached_actor(actor_class, name: str, **options):
+    """Gets or creates a named detached actor that runs the current package.
+
+    The code of a detached actor is fixed when it is created, so one created from
+    an older package is shut down, killed and created again. This is checked once
+    per process and name. Without a runtime package there is no version to
+    compare, and the actor has to be killed by hand to pick up new code.
+    """
+    version = get_runtime_package_version()
+    options = dict(
+        name=name,
+        namespace=settings.RAY_NAMESPACE,
+        lifetime="detached",
+        get_if_exists=True,
+        **options,
+    )
+    actor = actor_class.options(**options).remote(package_version=version)
+    if version is None or name in _checked_actors:
+        return actor
+    for _ in range(settings.RUNTIME_PACKAGE_REPLACE_ATTEMPTS):
+        current = _get_actor_version(actor)
+        if current == version:
+            _checked_actors.add(name)
+            return actor
+        if current is not None:
+            logger.info(f"Replacing actor {name} from package {current} by {version}")
+            ray.get(actor.shutdown.remote())
+        ray.kill(actor, no_restart=True)
+        # The name is freed once the actor is gone, until then it still resolves
+        time.sleep(settings.RUNTIME_PACKAGE_REPLACE_INTERVAL_S)
+        actor = actor_class.options(**options).remote(package_version=version)
+    raise RuntimeError(f"Could not start actor {name} from package {version}")
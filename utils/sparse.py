@@ -0,0 +1,72 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from settings import settings
+
+SparseVector = Tuple[List[int], List[float]]
+
+# Name of the sparse vector in the chunks collection, the dense one is unnamed
+SPARSE_VECTOR_NAME = "text"
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_SUBWORD = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words, plus the parts of snake_case and camelCase identifiers, so
+    `get_chunk_id` matches both itself and a query for "chunk id"."""
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word.lower())
+        parts = [p.lower() for part in word.split("_") for p in _SUBWORD.findall(part)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def _token_index(token: str) -> int:
+    # Stable across processes, unlike hash()
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class SparseEncoder:
+    """BM25-style lexical vectors for Qdrant sparse search.
+
+    Documents get the BM25 term-frequency weight of each token; the IDF part is
+    applied by Qdrant (the sparse vector uses the IDF modifier), so it stays correct
+    as the collection grows. Queries weigh every distinct token 1.
+    """
+
+    def __init__(
+        self,
+        k1: float = settings.SPARSE_BM25_K1,
+        b: float = settings.SPARSE_BM25_B,
+        avg_doc_length: float = settings.SPARSE_BM25_AVG_DOC_LENGTH,
+    ):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = avg_doc_length
+
+    @staticmethod
+    def _to_vector(weights: Dict[int, float]) -> SparseVector:
+        indices = sorted(weights)
+        return indices, [weights[i] for i in indices]
+
+    def encode_document(self, text: str) -> SparseVector:
+        counts = Counter(tokenize(text))
+        length = sum(counts.values())
+        norm = self.k1 * (1 - self.b + self.b * length / self.avg_doc_length)
+        weights: Dict[int, float] = {}
+        for token, tf in counts.items():
+            # Tokens colliding on the same index add up
+            index = _token_index(token)
+            weights[index] = weights.get(index, 0) + tf * (self.k1 + 1) / (tf + norm)
+        return self._to_vector(weights)
+
+    def encode_documents(self, texts: List[str]) -> List[SparseVector]:
+        return [self.encode_document(text) for text in texts]
+
+    def encode_query(self, text: str) -> SparseVector:
+        return self._to_vector({_token_index(token): 1.0 for token in tokenize(text)})
@@ -0,0 +1,122 @@
+import zlib
+from typing import Any, Dict, List, Optional, Set
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+from qdrant_client.http.exceptions import UnexpectedResponse
+
+from settings import settings
+
+
+class TenancyRouter:
+    """Maps assets to where their chunks live in Qdrant.
+
+    - payload: one shared collection; asset_id is a tenant index, so Qdrant stores
+      each asset's points together and filtered search only touches them.
+    - shard_key: one shared collection with custom sharding and a shard key per
+      asset; search only visits the queried assets' shards and deleting an asset
+      drops its shard. Needs Qdrant in distributed mode.
+    - groups: VECTOR_DB_TENANCY_GROUPS collections, an asset goes to the one picked
+      by a hash of its id; a query only searches the collections of its assets.
+
+    The strategy is fixed when a collection is created, changing it requires
+    re-ingesting into a new collection.
+    """
+
+    def __init__(
+        self,
+        strategy: str = settings.VECTOR_DB_TENANCY,
+        collection_name: str = settings.VECTOR_DB_COLLECTION_NAME,
+        groups: int = settings.VECTOR_DB_TENANCY_GROUPS,
+    ):
+        if strategy not in ("payload", "shard_key", "groups"):
+            raise ValueError(f"Tenancy strategy {strategy} is not supported")
+        self.strategy = strategy
+        self.collection_name = collection_name
+        self.groups = groups
+
+    def _get_group_collection_name(self, group: int) -> str:
+        return f"{self.collection_name}_group_{group}"
+
+    def get_collection_name(self, asset_id: str) -> str:
+        if self.strategy != "groups":
+            return self.collection_name
+        # Stable across processes, unlike hash()
+        group = zlib.crc32(asset_id.encode("utf-8")) % self.groups
+        return self._get_group_collection_name(group)
+
+    def get_collection_names(self) -> List[str]:
+        if self.strategy != "groups":
+            return [self.collection_name]
+        return [self._get_group_collection_name(i) for i in range(self.groups)]
+
+    def route(self, asset_ids: List[str]) -> Dict[str, List[str]]:
+        """Collection -> the queried assets it holds; an empty list of asset_ids
+        means all assets of all collections."""
+        if not asset_ids:
+            return {name: [] for name in self.get_collection_names()}
+        routes: Dict[str, List[str]] = {}
+        for asset_id in asset_ids:
+            routes.setdefault(self.get_collection_name(asset_id), []).append(asset_id)
+        return routes
+
+    def get_shard_key(self, asset_id: str) -> Optional[str]:
+        return asset_id if self.strategy == "shard_key" else None
+
+    def get_shard_key_selector(self, asset_ids: List[str]) -> Optional[List[str]]:
+        if self.strategy != "shard_key" or not asset_ids:
+            return None
+        return list(asset_ids)
+
+    @staticmethod
+    def get_shard_keys(cluster_info: models.CollectionClusterInfo) -> Set[str]:
+        """Shard keys of the collection, i.e. the assets it holds with shard_key."""
+        shards = [*cluster_info.local_shards, *cluster_info.remote_shards]
+        return {str(shard.shard_key) for shard in shards if shard.shard_key is not None}
+
+    def get_create_kwargs(self) -> Dict[str, Any]:
+        if self.strategy != "shard_key":
+            return {}
+        return {"sharding_method": models.ShardingMethod.CUSTOM}
+
+    def get_asset_id_index_schema(self) -> models.KeywordIndexParams:
+        return models.KeywordIndexParams(
+            type=models.KeywordIndexType.KEYWORD, is_tenant=True
+        )
+
+    def create_shard_key(self, client: QdrantClient, asset_id: str):
+        if self.strategy != "shard_key":
+            return
+        try:
+            client.create_shard_key(
+                self.get_collection_name(asset_id), shard_key=asset_id
+            )
+        except UnexpectedResponse as e:
+            # The asset was ingested before
+            if "already exists" not in str(e):
+                raise
+
+    def delete_asset(self, client: QdrantClient, asset_id: str):
+        collection_name = self.get_collection_name(asset_id)
+        if self.strategy == "shard_key":
+            try:
+                client.delete_shard_key(collection_name, shard_key=asset_id)
+            except UnexpectedResponse as e:
+                # The asset was never ingested or is already deleted
+                message = str(e).lower()
+                if "not found" not in message and "does not exist" not in message:
+                    raise
+            return
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(
+                filter=models.Filter(
+                    must=[
+                        models.FieldCondition(
+                            key="asset_id", match=models.MatchValue(value=asset_id)
+                        )
+                    ]
+                )
+            ),
+            wait=True,
+        )
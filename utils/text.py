@@ -0,0 +1,43 @@
+import hashlib
+from typing import Iterable, List
+
+from stop_words import get_stop_words
+
+from settings import settings
+
+
+class TextPreprocessor:
+    """Text preprocessing applied before embedding.
+
+    Ingestion and retrieval must preprocess text identically, so both go through
+    this class rather than their own copies. Stop words are matched exactly (case
+    sensitive) against whitespace-separated words.
+    """
+
+    def __init__(
+        self,
+        remove_stopwords: bool = settings.TEXT_REMOVE_STOPWORDS,
+        language: str = settings.TEXT_STOPWORDS_LANGUAGE,
+    ):
+        self.remove_stopwords = remove_stopwords
+        self.language = language
+        # get_stop_words returns a list, which makes every lookup a linear scan
+        self.stop_words = (
+            frozenset(get_stop_words(language)) if remove_stopwords else frozenset()
+        )
+
+    def preprocess(self, text: str) -> str:
+        if not self.remove_stopwords:
+            return text
+        stop_words = self.stop_words
+        return " ".join([word for word in text.split() if word not in stop_words])
+
+    def preprocess_many(self, texts: Iterable[str]) -> List[str]:
+        return [self.preprocess(text) for text in texts]
+
+
+def get_text_hash(text: str) -> str:
+    """Hash of a chunk's text, insensitive to case and whitespace so that chunks
+    differing only in formatting count as duplicates."""
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()